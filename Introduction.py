@@ -1,11 +1,8 @@
 import streamlit as st
 import pandas as pd
-import gc
 
 st.set_page_config(layout="wide", initial_sidebar_state="expanded", page_title="SimPy Visualisation Library")
 
-gc.collect()
-
 st.title("Visual Interactive Simulation (VIS) - Demonstration")
 
 st.markdown(
@@ -11,6 +11,9 @@ classes that allow easy control of random numbers.
 * Bernoulli
 * Normal
 * Uniform
+
+Buffered wraps any of the above so that samples are drawn from numpy in
+batches rather than one call per sample.
 '''
 
 import numpy as np
@@ -155,11 +158,17 @@ class Lognormal:
         sigma = math.sqrt(math.log(phi**2/m**2))
         return mu, sigma
 
-    def sample(self):
+    def sample(self, size=None):
         """
         Sample from the normal distribution
+
+        Params:
+        -------
+        size: int, optional (default=None)
+            the number of samples to return.  If size=None then a single
+            sample is returned.
         """
-        return self.rng.lognormal(self.mu, self.sigma)
+        return self.rng.lognormal(self.mu, self.sigma, size=size)
 
 
 class Normal:
@@ -306,3 +315,63 @@ class Poisson:
             sample is returned.
         '''
         return self.rand.poisson(self.mean, size=size)
+
+
+class Buffered:
+    '''
+    Draws samples from a distribution in batches of buffer_size and
+    hands them out one at a time.  Each call to numpy has a fixed
+    overhead, so for distributions sampled once per patient this is
+    much quicker than a call per sample.
+
+    Samples are returned in the same order as calling the wrapped
+    distribution once per sample, as long as its random generator is
+    only used through this wrapper.
+    '''
+    def __init__(self, distribution, buffer_size=4096):
+        '''
+        Constructor
+
+        Params:
+        ------
+        distribution: object
+            distribution with a sample(size) method e.g. Bernoulli
+
+        buffer_size: int, optional (default=4096)
+            number of samples to draw each time the buffer is empty.
+        '''
+        self.distribution = distribution
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.index = 0
+
+    def _refill(self):
+        #python scalars, as returned by sample() with size=None
+        self.buffer = self.distribution.sample(size=self.buffer_size).tolist()
+        self.index = 0
+
+    def sample(self, size=None):
+        '''
+        Return the next sample(s) from the buffer
+
+        Params:
+        -------
+        size: int, optional (default=None)
+            the number of samples to return.  If size=None then a single
+            sample is returned.
+        '''
+        if size is None:
+            if self.index == len(self.buffer):
+                self._refill()
+            value = self.buffer[self.index]
+            self.index += 1
+            return value
+
+        samples = []
+        while len(samples) < size:
+            if self.index == len(self.buffer):
+                self._refill()
+            take = self.buffer[self.index:self.index + size - len(samples)]
+            samples.extend(take)
+            self.index += len(take)
+        return np.array(samples)
@@ -38,6 +38,7 @@ from examples.distribution_classes import (
     Uniform,
     Bernoulli,
     Lognormal,
+    Buffered,
 )
 from examples.simulation_utility_functions import trace, CustomResource
 
@@ -203,44 +204,45 @@ class Scenario:
         self.seeds = rng_streams.integers(0, 999999999, size=self.n_streams)
 
         # create distributions
+        # (Buffered draws samples from numpy in batches)
 
         # Triage duration
-        self.triage_dist = Exponential(self.triage_mean, random_seed=self.seeds[0])
+        self.triage_dist = Buffered(Exponential(self.triage_mean, random_seed=self.seeds[0]))
 
         # Registration duration (non-trauma only)
-        self.reg_dist = Lognormal(
+        self.reg_dist = Buffered(Lognormal(
             self.reg_mean, np.sqrt(self.reg_var), random_seed=self.seeds[1]
-        )
+        ))
 
         # Evaluation (non-trauma only)
-        self.exam_dist = Normal(
+        self.exam_dist = Buffered(Normal(
             self.exam_mean, np.sqrt(self.exam_var), random_seed=self.seeds[2]
-        )
+        ))
 
         # Trauma/stablisation duration (trauma only)
-        self.trauma_dist = Exponential(self.trauma_mean, random_seed=self.seeds[3])
+        self.trauma_dist = Buffered(Exponential(self.trauma_mean, random_seed=self.seeds[3]))
 
         # Non-trauma treatment
-        self.nt_treat_dist = Lognormal(
+        self.nt_treat_dist = Buffered(Lognormal(
             self.non_trauma_treat_mean,
             np.sqrt(self.non_trauma_treat_var),
             random_seed=self.seeds[4],
-        )
+        ))
 
         # treatment of trauma patients
-        self.treat_dist = Lognormal(
+        self.treat_dist = Buffered(Lognormal(
             self.trauma_treat_mean,
             np.sqrt(self.non_trauma_treat_var),
             random_seed=self.seeds[5],
-        )
+        ))
 
         # probability of non-trauma patient requiring treatment
-        self.nt_p_treat_dist = Bernoulli(
+        self.nt_p_treat_dist = Buffered(Bernoulli(
             self.non_trauma_treat_p, random_seed=self.seeds[6]
-        )
+        ))
 
         # probability of non-trauma versus trauma patient
-        self.p_trauma_dist = Bernoulli(self.prob_trauma, random_seed=self.seeds[7])
+        self.p_trauma_dist = Buffered(Bernoulli(self.prob_trauma, random_seed=self.seeds[7]))
 
         # init sampling for non-stationary poisson process
         self.init_nspp()
@@ -254,17 +256,17 @@ class Scenario:
         self.lambda_max = self.arrivals["arrival_rate"].max()  # pylint: disable=attribute-defined-outside-init
 
         # thinning exponential
-        self.arrival_dist = Exponential(
+        self.arrival_dist = Buffered(Exponential(
             60.0 / self.lambda_max,  # pylint: disable=attribute-defined-outside-init
             random_seed=self.seeds[8],
-        )
+        ))
 
         # thinning uniform rng
-        self.thinning_rng = Uniform(
+        self.thinning_rng = Buffered(Uniform(
             low=0.0,
             high=1.0,  # pylint: disable=attribute-defined-outside-init
             random_seed=self.seeds[9],
-        )
+        ))
 
 
 # ## Patient Pathways Process Logic
@@ -1,4 +1,7 @@
 # ## Executing a model
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import numpy as np
 from examples.ex_2_branching_and_optional_paths.simulation_summary_functions import SimulationSummary
@@ -53,12 +56,38 @@ def single_run(scenario,
 
     return summary_df
 
+#Scenario and run settings held by each worker process
+_worker_args = None
+
+def _init_worker(scenario, rc_period, return_detailed_logs):
+    '''
+    Store the scenario and run settings in a worker process.  Called
+    once per worker so the scenario is only sent once rather than with
+    every replication.
+    '''
+    global _worker_args
+    _worker_args = (scenario, rc_period, return_detailed_logs)
+
+def _run_worker_replication(random_no_set):
+    '''
+    single_run using the scenario and settings stored by _init_worker
+    '''
+    scenario, rc_period, return_detailed_logs = _worker_args
+    return single_run(scenario,
+                      rc_period,
+                      random_no_set=random_no_set,
+                      return_detailed_logs=return_detailed_logs)
+
 def multiple_replications(scenario,
                           rc_period=60*24*10,
                           n_reps=10,
-                          return_detailed_logs=False):
+                          return_detailed_logs=False,
+                          n_jobs=None,
+                          callback=None):
     '''
     Perform multiple replications of the model.
+    Replications are independent so they are run in parallel in
+    separate processes.
 
     Params:
     ------
@@ -72,18 +101,53 @@ def multiple_replications(scenario,
     n_reps: int, optional (default=DEFAULT_N_REPS)
         Number of independent replications to run.
 
+    return_detailed_logs: bool, optional (default=False)
+        If True also return the event log of every replication.
+
+    n_jobs: int, optional (default=None)
+        Number of worker processes.  None uses all available CPUs.
+        1 runs the replications one after the other in this process.
+
+    callback: callable, optional (default=None)
+        Called as callback(n_complete, n_reps) each time a replication
+        finishes e.g. to update a progress bar.  It is always called from
+        this process.
+
     Returns:
     --------
     pandas.DataFrame
     '''
+    # each single_run sets scenario.random_number_set, so rep's offset is
+    # added to the previous rep's set (e.g. 42, 43, 45, 48...).  The sets
+    # are worked out up front so the reps can be run in any order.
+    random_no_sets = [scenario.random_number_set + (rep * (rep + 1)) // 2
+                      for rep in range(n_reps)]
+
+    if n_jobs == 1 or n_reps == 1:
+        results = []
+        for random_no_set in random_no_sets:
+            results.append(single_run(scenario,
+                                      rc_period,
+                                      random_no_set=random_no_set,
+                                      return_detailed_logs=return_detailed_logs))
+            if callback is not None:
+                callback(len(results), n_reps)
+    else:
+        #the scenario is sent to each worker once when it starts.  Only
+        #the random number sets (and results) are sent per replication.
+        with ProcessPoolExecutor(max_workers=min(n_jobs or os.cpu_count(), n_reps),
+                                 initializer=_init_worker,
+                                 initargs=(scenario, rc_period, return_detailed_logs)) as executor:
+            futures = [executor.submit(_run_worker_replication, random_no_set)
+                       for random_no_set in random_no_sets]
+            if callback is not None:
+                for n_complete, _ in enumerate(as_completed(futures), start=1):
+                    callback(n_complete, n_reps)
+            # results are kept in rep order, whatever order they finish in
+            results = [future.result() for future in futures]
 
     # If not returning detailed logs, do some additional steps before returning the summary df
     if not return_detailed_logs:
-        results = [single_run(scenario,
-                            rc_period,
-                            random_no_set=(scenario.random_number_set)+rep)
-                for rep in range(n_reps)]
-
         # format and return results in a dataframe
         df_results_summary = pd.concat(results)
         df_results_summary.index = np.arange(1, len(df_results_summary)+1)
@@ -92,30 +156,17 @@ def multiple_replications(scenario,
         return df_results_summary
 
     else:
-        detailed_results = [
-            {
-             'rep': rep+1,
-             'results': single_run(scenario,
-                                   rc_period,
-                                   random_no_set=(scenario.random_number_set)+rep,
-                                   return_detailed_logs=True)
-            }
-            for rep in range(n_reps)
-        ]
-
         # format and return results in a dataframe
-        df_results_summary = pd.concat([result['results'][0] for result in detailed_results])
+        df_results_summary = pd.concat([result[0] for result in results])
         df_results_summary.index = np.arange(1, len(df_results_summary)+1)
         df_results_summary.index.name = 'rep'
 
         event_log_df = pd.concat(
             [
-            (result['results'][1]).assign(rep = result['rep']) 
-             for result 
-             in detailed_results
+            (result[1]).assign(rep = rep + 1)
+             for rep, result
+             in enumerate(results)
              ]
              )
 
-        # format and return results in a dataframe
-
         return df_results_summary, event_log_df 
@@ -8,10 +8,11 @@ at a mental health assessment network across in Devon
 
 import pandas as pd
 import numpy as np
-import itertools
 import simpy
+from operator import attrgetter
 
 from examples.distribution_classes import Bernoulli, Discrete, Poisson
+from examples.simulation_utility_functions import EventLog
 
 def generate_seed_vector(one_seed_to_rule_them_all=42, size=20):
     '''
@@ -31,6 +32,34 @@ def generate_seed_vector(one_seed_to_rule_them_all=42, size=20):
     rng = np.random.default_rng(seed=one_seed_to_rule_them_all)
     return rng.integers(low=1000, high=10**10, size=size)
 
+def pack_patient_id(t, i):
+    '''
+    Return an integer patient id for the i'th referral on day t.
+
+    The day is held in the upper 32 bits and the referral number in
+    the lower 32 bits.  Use unpack_patient_id to recover a "t_i" label.
+
+    Params:
+    ------
+    t: int
+        day of referral
+
+    i: int or np.ndarray
+        index of the referral(s) on day t
+    '''
+    return (t << 32) | i
+
+def unpack_patient_id(patient_id):
+    '''
+    Return the "t_i" label of a patient id created by pack_patient_id.
+
+    Params:
+    ------
+    patient_id: int
+        packed patient id
+    '''
+    return f"{patient_id >> 32}_{patient_id & 0xffffffff}"
+
 ANNUAL_DEMAND = 16328
 LOW_PRIORITY_MIN_WAIT = 3
 HIGH_PRIORITY_MIN_WAIT = 1
@@ -115,7 +144,8 @@ class Scenario():
                                        random_seed=self.seeds[1])
 
         #create a distribution for sampling a patients local clinic.
-        elements = [i for i in range(len(self.clinic_demand))]
+        #(array of elements so a day of referrals can be sampled at once)
+        elements = np.arange(len(self.clinic_demand))
         probs = self.clinic_demand['prop'].to_numpy()
         self.clinic_dist = Discrete(elements, probs, random_seed=self.seeds[2])
 
@@ -483,6 +513,10 @@ class PatientReferral(object):
     Schedule an assessment for that day.
 
     '''
+    #there is one instance per referral so avoid a __dict__ per patient
+    __slots__ = ('env', 'args', 'referral_t', 'home_clinic', 'booked_clinic',
+                 'booker', 'event_log', 'identifier', 'waiting_time')
+
     def __init__(self, env, args, referral_t, home_clinic, booker, event_log, identifier):
         self.env = env
         self.args = args
@@ -512,13 +546,19 @@ class PatientReferral(object):
         2. book slot at clinic
         3. schedule process to complete at that time
         '''
-        self.event_log.append(
-            {'patient': self.identifier,
-             'pathway': self.priority,
-             'event_type': 'arrival_departure',
+        #look up the logging method once rather than for every event
+        log_event = self.event_log.append
+
+        #fields shared by all of the patient's events
+        header = {'patient': self.identifier,
+                  'pathway': self.priority,
+                  'home_clinic': int(self.home_clinic)}
+
+        log_event(
+            {'event_type': 'arrival_departure',
              'event': 'arrival',
-             'home_clinic': int(self.home_clinic),
-             'time': self.env.now}
+             'time': self.env.now},
+            header
         )
 
 
@@ -529,15 +569,13 @@ class PatientReferral(object):
         #book slot at clinic = time of referral + waiting_time
         self.booker.book_slot(best_t, self.booked_clinic)
 
-        self.event_log.append(
-            {'patient': self.identifier,
-             'pathway': self.priority,
-             'event_type': 'queue',
+        log_event(
+            {'event_type': 'queue',
              'event': 'appointment_booked_waiting',
              'booked_clinic': int(self.booked_clinic),
-             'home_clinic': int(self.home_clinic),
              'time': self.env.now
-             }
+             },
+            header
         )
 
         #wait for appointment
@@ -549,25 +587,21 @@ class PatientReferral(object):
         self.waiting_time = best_t - self.referral_t
 
         # Use appointment
-        self.event_log.append(
-            {'patient': self.identifier,
-             'pathway': self.priority,
-             'event_type': 'queue',
+        log_event(
+            {'event_type': 'queue',
              'event': 'have_appointment',
              'booked_clinic': int(self.booked_clinic),
-             'home_clinic': int(self.home_clinic),
              'time': self.env.now,
              'wait': self.waiting_time
-             }
+             },
+            header
         )
 
-        self.event_log.append(
-            {'patient': self.identifier,
-             'pathway': self.priority,
-             'event_type': 'arrival_departure',
+        log_event(
+            {'event_type': 'arrival_departure',
              'event': 'depart',
-             'home_clinic': int(self.home_clinic),
-             'time': self.env.now+1}
+             'time': self.env.now+1},
+            header
         )
 
 
@@ -603,7 +637,13 @@ class AssessmentReferralModel(object):
         #list of patients referral processes
         self.referrals = []
 
-        self.event_log = []
+        #column oriented log of events for the animation
+        #pathway and event_type only take a handful of values so are encoded
+        self.event_log = EventLog(encode=('pathway', 'event_type'))
+
+        #patients referred out are held as a single record and only
+        #expanded to arrival, referred_out and depart events in event_log_df()
+        self.referred_out = {'patient': [], 'home_clinic': [], 'time': []}
 
         #simpy processes
         self.env.process(self.generate_arrivals())
@@ -617,9 +657,10 @@ class AssessmentReferralModel(object):
 
     def generate_arrivals(self):
         '''
-        Time slicing simulation.  The model steps forward by a single
-        day and simulates the number of arrivals from a Poisson
-        distribution.  The following process is then applied.
+        Time slicing simulation.  The number of arrivals on each day
+        is sampled from a Poisson distribution up front and the model
+        steps forward to each day with arrivals.  The following process
+        is then applied.
 
         1. Sample the region of the referral from a Poisson distribution
         2. Triage - is an appointment made for the patient or are they referred
@@ -627,101 +668,144 @@ class AssessmentReferralModel(object):
         3. A referral process is initiated for the patient.
 
         '''
-        #loop a day at a time.
-        for t in itertools.count():
+        #total number of referrals on each day of the run
+        n_days = int(np.ceil(self.args.run_length))
+        daily_referrals = self.args.arrival_dist.sample(size=n_days).tolist()
 
-            #total number of referrals today
-            n_referrals = self.args.arrival_dist.sample()
+        #step straight to the next day with referrals.
+        for t, n_referrals in enumerate(daily_referrals):
+            if n_referrals == 0:
+                continue
 
-            #loop through all referrals recieved that day
-            for i in range(n_referrals):
-                #sample clinic based on empirical proportions
-                clinic_id = self.args.clinic_dist.sample()
-                clinic = self.args.clinics[clinic_id]
+            yield self.env.timeout(t - self.env.now)
 
-                #triage patient and refer out of system if appropraite
-                referred_out = clinic.ref_out_dist.sample()
+            #sample clinics and triage all referrals recieved that day
+            clinic_ids, referred_out = self.triage_referrals(n_referrals)
 
-                #if patient is accepted to clinic
-                if referred_out == 0:
+            #loop through the referrals accepted by a clinic
+            for i in np.flatnonzero(referred_out == 0):
+                clinic_id = clinic_ids[i]
 
-                    #is patient high priority?
-                    high_priority = self.args.priority_dist.sample()
+                #is patient high priority?
+                high_priority = self.args.priority_dist.sample()
 
-                    if high_priority == 1:
-                        #different policy if pooling or not
-                        if self.args.pooling:
-                            booker = HighPriorityPooledBooker(self.args)
-                        else:
-                            booker = HighPriorityBooker(self.args)
+                if high_priority == 1:
+                    #different policy if pooling or not
+                    if self.args.pooling:
+                        booker = HighPriorityPooledBooker(self.args)
                     else:
-                        #different policy if pooling or not
-                        if self.args.pooling:
-                            booker = LowPriorityPooledBooker(self.args)
-                        else:
-                            booker = LowPriorityBooker(self.args)
-
-                    #create instance of PatientReferral
-                    patient = PatientReferral(self.env, self.args, t,
-                                              clinic_id, booker, self.event_log, f"{t}_{i}")
-
-                    #start a referral assessment process for patient.
-                    self.env.process(patient.execute())
-
-                    #only collect results after warm-up complete
-                    if self.env.now > self.args.warm_up_period:
-                        #store patient for calculating waiting time stats at end
-                        self.referrals.append(patient)
-
-                # Add event logging for patients triaged and referred out
-                if referred_out == 1:
-                    self.event_log.append(
-                        {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'arrival_departure',
-                        'event': 'arrival',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now
-                        }
-                    )
-
-                    self.event_log.append(
-                        {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'queue',
-                        'event': f'referred_out_{clinic_id}',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now
-                        }
-                    )
-
-                    self.event_log.append(
-                        {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'arrival_departure',
-                        'event': 'depart',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now + 1
-                        }
-                    )
-
-            #timestep by one day
-            yield self.env.timeout(1)
+                        booker = HighPriorityBooker(self.args)
+                else:
+                    #different policy if pooling or not
+                    if self.args.pooling:
+                        booker = LowPriorityPooledBooker(self.args)
+                    else:
+                        booker = LowPriorityBooker(self.args)
+
+                #create instance of PatientReferral
+                patient = PatientReferral(self.env, self.args, t,
+                                          clinic_id, booker, self.event_log,
+                                          pack_patient_id(t, i))
+
+                #start a referral assessment process for patient.
+                self.env.process(patient.execute())
+
+                #only collect results after warm-up complete
+                if self.env.now > self.args.warm_up_period:
+                    #store patient for calculating waiting time stats at end
+                    self.referrals.append(patient)
+
+            # Add event logging for patients triaged and referred out
+            self.log_referred_out(t, np.flatnonzero(referred_out == 1), clinic_ids)
+
+    def triage_referrals(self, n_referrals):
+        '''
+        Sample the home clinic of a day of referrals and triage them.
+
+        Params:
+        ------
+        n_referrals: int
+            number of referrals recieved that day
+
+        Returns:
+        -------
+        (np.ndarray, np.ndarray)
+        (clinic_ids, referred_out) where referred_out is 1 if the patient
+        is referred to another service
+        '''
+        #sample clinic based on empirical proportions
+        clinic_ids = self.args.clinic_dist.sample(size=n_referrals)
+
+        #triage patients and refer out of system if appropraite.
+        #one draw per clinic for all of its referrals that day
+        referred_out = np.zeros(n_referrals, dtype=np.int8)
+        for clinic_id in np.unique(clinic_ids):
+            at_clinic = clinic_ids == clinic_id
+            ref_out_dist = self.args.clinics[clinic_id].ref_out_dist
+            referred_out[at_clinic] = ref_out_dist.sample(size=at_clinic.sum())
+
+        return clinic_ids, referred_out
+
+    def log_referred_out(self, t, referral_ids, clinic_ids):
+        '''
+        Record patients triaged and referred to another service.
+
+        Params:
+        ------
+        t: int
+            day of referral
+
+        referral_ids: np.ndarray
+            index of the referred out patients in the day's referrals
+
+        clinic_ids: np.ndarray
+            home clinic of each of the day's referrals
+        '''
+        self.referred_out['patient'].extend(pack_patient_id(t, referral_ids).tolist())
+        self.referred_out['home_clinic'].extend(clinic_ids[referral_ids].tolist())
+        self.referred_out['time'].extend([self.env.now] * len(referral_ids))
+
+    def event_log_df(self):
+        '''
+        Return the full event log as a DataFrame.
+
+        Each referred out patient is expanded to an arrival, a
+        referred_out_{clinic} queue event and a depart event the
+        following day.
+        '''
+        referred_out = pd.DataFrame(self.referred_out)
+        referred_out['pathway'] = "Unsuitable for service"
+
+        arrivals = referred_out.assign(event_type='arrival_departure',
+                                       event='arrival')
+
+        referrals = referred_out.assign(
+            event_type='queue',
+            event='referred_out_' + referred_out['home_clinic'].astype(str)
+        )
+
+        departures = referred_out.assign(event_type='arrival_departure',
+                                         event='depart',
+                                         time=referred_out['time'] + 1)
+
+        event_log = pd.concat([self.event_log.to_dataframe(), arrivals,
+                               referrals, departures], ignore_index=True)
+
+        return event_log.sort_values('time', kind='stable', ignore_index=True)
 
     def process_run_results(self):
         '''
         Produce summary results split by priority...
         '''
 
-        results_all = [p.waiting_time for p in self.referrals
-               if not p.waiting_time is None]
-
-        results_low = [p.waiting_time for p in self.referrals
-                       if not (p.waiting_time is None) and p.priority == 1]
+        #waiting time (NaN if no appointment yet) and priority of each referral
+        waiting_times = np.array(list(map(attrgetter('waiting_time'), self.referrals)),
+                                 dtype=np.float64)
+        priorities = np.fromiter(map(attrgetter('priority'), self.referrals),
+                                 dtype=np.int8, count=len(self.referrals))
 
-        results_high = [p.waiting_time for p in self.referrals
-                       if (not p.waiting_time is None) and p.priority == 2]
+        seen = ~np.isnan(waiting_times)
 
-        self.results_all = results_all
-        self.results_low = results_low
-        self.results_high = results_high
+        self.results_all = waiting_times[seen].tolist()
+        self.results_low = waiting_times[seen & (priorities == 1)].tolist()
+        self.results_high = waiting_times[seen & (priorities == 2)].tolist()
@@ -8,4 +8,5 @@ def single_run(args, rep=0):
     model.run()
     model.process_run_results()
 
-    return model.results_all, model.results_low, model.results_high, model.event_log
+    return model.results_all, model.results_low, model.results_high, \
+        model.event_log_df()
@@ -1,4 +1,4 @@
-import pandas as pd
+from examples.simulation_utility_functions import summarise_groups
 
 def results_summary(results_all, results_low, results_high):
     '''
@@ -19,9 +19,6 @@ def results_summary(results_all, results_low, results_high):
     -------
         pd.DataFrame
     '''
-    summary_frame = pd.concat([pd.DataFrame(results_all).describe(),
-                               pd.DataFrame(results_low).describe(),
-                               pd.DataFrame(results_high).describe()],
-                               axis=1)
-    summary_frame.columns = ['all', 'low_pri', 'high_pri']
-    return summary_frame
+    return summarise_groups({'all': results_all,
+                             'low_pri': results_low,
+                             'high_pri': results_high})
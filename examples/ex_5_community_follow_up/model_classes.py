@@ -7,36 +7,31 @@ at a mental health assessment network across in Devon
 '''
 import pandas as pd
 import numpy as np
-import itertools
+import heapq
 import simpy
-import random
-import queue
-from dataclasses import dataclass, field
-from typing import Any
-
-
-@dataclass(order=True)
-class PrioritizedItem:
-    priority: int
-    item: Any=field(compare=False)
+from operator import attrgetter
 
 def trace(msg):
     '''
-    Utility function for traceing a trace as the
+    Utility function for printing a trace as the
     simulation model executes.
     Set the TRACE constant to False, to turn tracing off.
 
+    Call sites check TRACE before calling trace() so that the
+    message is not formatted when tracing is off.
+
     Params:
     -------
     msg: str
-        string to trace to screen.
+        string to print to screen.
     '''
-    if TRACE:
-        trace(msg)
+    print(msg)
 
 TRACE = False
 
-from examples.distribution_classes import Bernoulli, Discrete, Poisson, Lognormal
+from examples.distribution_classes import Bernoulli, Discrete, Poisson, Lognormal, \
+    Buffered
+from examples.simulation_utility_functions import EventLog
 
 def generate_seed_vector(one_seed_to_rule_them_all=42, size=30):
     '''
@@ -86,10 +81,108 @@ SD_FOLLOW_UPS_LOW_INTENSITY = 3
 LOW_INTENSITY_FOLLOW_UP_TARGET_INTERVAL = 14
 HIGH_INTENSITY_FOLLOW_UP_TARGET_INTERVAL = 7
 
+#lookups indexed by follow-up intensity (0 = low, 1 = high)
+_INTENSITY_STR = ('low', 'high')
+_INTENSITY_SLOT = (0.5, 1.0)
+_INTENSITY_INTERVAL = (LOW_INTENSITY_FOLLOW_UP_TARGET_INTERVAL,
+                       HIGH_INTENSITY_FOLLOW_UP_TARGET_INTERVAL)
+
+#columns of the follow-up events, logged with EventLog.append_values
+_BOOKED_KEYS = ('event_type', 'event', 'follow_up', 'follow_up_intensity',
+                'follow_ups_intended', 'time', 'true_time')
+_APPOINTMENT_KEYS = ('event_type', 'event', 'time', 'type', 'follow_up',
+                     'follow_up_intensity', 'follow_ups_intended', 'interval')
+
 #targets in working days
 TARGET_HIGH = 5
 TARGET_LOW = 20
 
+def find_first_slot(diaries, start, clinics, block_size=32):
+    '''
+    Find the first day on or after start with a free slot at any of
+    the clinics.
+
+    The diaries are searched a block of days at a time (doubling the
+    block each time one is empty) so that the search stops soon after
+    the first free slot rather than checking every remaining day.
+
+    Params:
+    ------
+    diaries: list
+        list of np.ndarray diaries (day x clinic).  The free slots are
+        the sum of the diaries e.g. public and carve out slots.
+
+    start: int
+        first day to search
+
+    clinics: int or np.ndarray
+        index of the clinic(s) to search
+
+    block_size: int, optional (default=32)
+        number of days in the first block searched
+
+    Returns:
+    -------
+    (int, np.ndarray)
+    (best_t, free slots per clinic on day best_t) or (None, None) if
+    there are no free slots in the diary.
+    '''
+    n_days = len(diaries[0])
+    while start < n_days:
+        slots = sum(diary[start:start+block_size, clinics] for diary in diaries)
+
+        day_has_slot = slots > 0
+        if day_has_slot.ndim > 1:
+            day_has_slot = day_has_slot.any(axis=1)
+
+        #argmax stops at the first True
+        best_t = day_has_slot.argmax()
+        if day_has_slot[best_t]:
+            return start + best_t, slots[best_t]
+
+        start += block_size
+        block_size *= 2
+
+    return None, None
+
+def find_first_day(day_bits, start, clinic_bits, block_size=32):
+    '''
+    Find the first day on or after start where any of the clinics in
+    clinic_bits has a free slot, using a bit-packed availability diary.
+
+    Searched a block of days at a time in the same way as find_first_slot
+
+    Params:
+    ------
+    day_bits: np.ndarray
+        np.uint64 per day. Bit c is set if clinic c has a free slot.
+
+    start: int
+        first day to search
+
+    clinic_bits: np.uint64
+        bits of the clinics to search
+
+    block_size: int, optional (default=32)
+        number of days in the first block searched
+
+    Returns:
+    -------
+    int or None if there are no free slots in the diary.
+    '''
+    n_days = len(day_bits)
+    while start < n_days:
+        day_has_slot = (day_bits[start:start+block_size] & clinic_bits) != 0
+
+        best_t = day_has_slot.argmax()
+        if day_has_slot[best_t]:
+            return start + best_t
+
+        start += block_size
+        block_size *= 2
+
+    return None
+
 class Clinic():
     '''
     A clinic has a probability of refering patients
@@ -99,7 +192,7 @@ class Clinic():
 
         #prob patient is referred to another service
         self.prob_referral_out = prob_referral_out
-        self.ref_out_dist = Bernoulli(prob_referral_out, random_seed)
+        self.ref_out_dist = Buffered(Bernoulli(prob_referral_out, random_seed))
 
 class Scenario():
     '''
@@ -170,69 +263,121 @@ class Scenario():
         #input data from files
         self.clinic_demand = demand_file
         self.weekly_slots = slots_file
-        self.pooling_np = pooling_file.to_numpy().T[1:].T
-        self.existing_caseload = existing_caseload_file.iloc[0,]
+        #which clinics each home clinic is pooled with (label column dropped)
+        self.pooling_np = np.ascontiguousarray(
+            pooling_file.iloc[:, 1:].to_numpy(dtype=np.bool_)
+            )
+
+        #the clinics pooled with each home clinic (fixed for the whole run)
+        self.pool_options = [np.flatnonzero(row) for row in self.pooling_np]
+
+        #caseload of each clinician (label column dropped).  This is
+        #updated on every booking and departure so is held as an array
+        self.existing_caseload_np = existing_caseload_file.iloc[0, 1:].to_numpy(dtype=np.float64).copy()
+        self.caseload_clinicians = existing_caseload_file.columns[1:]
+
+        #weekly slot templates (day of week x clinic) split into slots
+        #carved out for high priority patients and slots open to all
+        self.weekly_slots_np = self.weekly_slots.to_numpy()
+        self.priority_template_np = np.rint(self.weekly_slots_np * self.prop_carve_out).astype(np.uint8)
+        self.open_template_np = self.weekly_slots_np - self.priority_template_np
+
+        #theoretical maximum caseload of each clinician from the slots file
+        self.weekly_slots_sum = self.weekly_slots_np.sum(axis=0)
+        self.caseload_slots_per_clinician = np.floor(self.weekly_slots_sum * self.caseload_multiplier)
 
         #These represent the 'diaries' of bookings
+        #They are held as numpy arrays (day x clinic) while the model runs
+        #use diary_to_df() to get a DataFrame for reporting.
 
         # 1. carve out
-        self.carve_out_slots = self.create_carve_out(run_length,
-                                                     self.weekly_slots)
+        self.carve_out_slots_np = self.create_carve_out(run_length,
+                                                        self.priority_template_np)
 
         # 2. available slots and one for the bookings.
-        self.available_slots = self.create_slots(self.run_length,
-                                                 self.weekly_slots)
+        self.available_slots_np = self.create_slots(self.run_length,
+                                                    self.open_template_np)
 
         # 3. the bookings which can be used to calculate slot utilisation
-        self.bookings = self.create_bookings(self.run_length,
-                                             len(self.weekly_slots.columns))
+        self.bookings_np = self.create_bookings(self.run_length,
+                                                len(self.weekly_slots.columns))
+
+        #earliest day each clinic has a free public slot.  Slots are only
+        #removed during a run so this only ever moves forward.
+        has_slot = self.available_slots_np > 0
+        self.next_free_day = np.where(has_slot.any(axis=0),
+                                      has_slot.argmax(axis=0),
+                                      len(self.available_slots_np))
+
+        #bit-packed copy of has_slot: bit c of available_day_bits[day] is
+        #set if clinic c has a free public slot that day.  Lets pooled
+        #bookers check all of their clinics for a day with one & operation.
+        #(not used if there are more clinics than bits)
+        n_clinics = self.available_slots_np.shape[1]
+        if n_clinics <= 64:
+            self.clinic_bits = np.left_shift(np.uint64(1),
+                                             np.arange(n_clinics, dtype=np.uint64))
+            self.available_day_bits = (has_slot * self.clinic_bits).sum(axis=1,
+                                                                       dtype=np.uint64)
+            #bits of all the clinics pooled with each home clinic
+            self.pool_bits = [np.bitwise_or.reduce(self.clinic_bits[options])
+                              for options in self.pool_options]
+        else:
+            self.clinic_bits = None
+            self.available_day_bits = None
+            self.pool_bits = None
 
         #sampling distributions
+        #(Buffered draws samples from numpy in batches)
         # Arrival rate of patients to the service
-        self.arrival_dist = Poisson(annual_demand / 52 / 5,
-                                    random_seed=self.seeds[0])
+        self.arrival_dist = Buffered(Poisson(annual_demand / 52 / 5,
+                                             random_seed=self.seeds[0]))
         # Initial priority setting for assessment
-        self.priority_dist = Bernoulli(prop_high_priority,
-                                       random_seed=self.seeds[1])
+        self.priority_dist = Buffered(Bernoulli(prop_high_priority,
+                                                random_seed=self.seeds[1]))
 
         # Determining whether people will have follow-up appointments
-        self.follow_up_dist_high_priority = Bernoulli(
+        self.follow_up_dist_high_priority = Buffered(Bernoulli(
             prop_high_priority_ongoing_appointments,
             random_seed=self.seeds[2]
-            )
-        self.follow_up_dist_low_priority = Bernoulli(
+            ))
+        self.follow_up_dist_low_priority = Buffered(Bernoulli(
             prop_low_priority_ongoing_appointments,
             random_seed=self.seeds[3]
-            )
+            ))
 
         # Setting intensity (frequency) of follow-up appointments
-        self.intensity_dist_high_priority = Bernoulli(
+        self.intensity_dist_high_priority = Buffered(Bernoulli(
             prop_high_priority_assessed_high_intensity,
             random_seed=self.seeds[4]
-            )
-        self.intensity_dist_low_priority = Bernoulli(
+            ))
+        self.intensity_dist_low_priority = Buffered(Bernoulli(
             prop_low_priority_assessed_high_intensity,
             random_seed=self.seeds[5]
-            )
+            ))
 
         # Setting number of follow up appointments - high intensity
-        self.num_follow_up_dist_high_intensity = Lognormal(
+        self.num_follow_up_dist_high_intensity = Buffered(Lognormal(
             mean=mean_follow_ups_high_intensity,
             stdev=sd_follow_ups_high_intensity,
             random_seed=self.seeds[6]
-            )
+            ))
 
-        self.num_follow_up_dist_low_intensity = Lognormal(
+        self.num_follow_up_dist_low_intensity = Buffered(Lognormal(
             mean=mean_follow_ups_low_intensity,
             stdev=sd_follow_ups_low_intensity,
             random_seed=self.seeds[7]
-            )
+            ))
 
 
         #create a distribution for sampling a patients local clinic.
-        elements = [i for i in range(len(self.clinic_demand))]
+        elements = np.arange(len(self.clinic_demand))
         probs = self.clinic_demand['prop'].to_numpy()
-        self.clinic_dist = Discrete(elements, probs, random_seed=self.seeds[8])
+        self.clinic_dist = Buffered(Discrete(elements, probs, random_seed=self.seeds[8]))
+
+        # Choosing between clinicians with a slot on the same day
+        # (last seed so it does not overlap the clinic seeds below)
+        self.clinic_choice_rng = np.random.default_rng(self.seeds[-1])
 
         #create a list of clinic objects
         self.clinics = []
@@ -241,50 +386,73 @@ class Scenario():
                             random_seed=self.seeds[i+9])
             self.clinics.append(clinic)
 
-    def create_carve_out(self, run_length, capacity_template):
+    def remove_available_slot(self, booking_t, clinic_id):
+        '''
+        Remove a public slot from the diary and update the earliest
+        free day of the clinic if that day is now full.
 
-        #proportion of total capacity carved out for high priority patients
-        priority_template = (capacity_template * self.prop_carve_out).round().astype(np.uint8)
+        Params:
+        ------
+        booking_t: int
+            Day of booking
 
-        priority_slots = priority_template.copy()
+        clinic_id: int
+            the clinic identifier
+        '''
+        self.available_slots_np[booking_t, clinic_id] -= 1
 
-        #longer than run length as patients will need to book ahead
-        for day in range(int(run_length*1.5)):
-            priority_slots = pd.concat([priority_slots, priority_template.copy()],
-                                        ignore_index=True)
+        if self.available_slots_np[booking_t, clinic_id] > 0:
+            return
 
-        priority_slots.index.rename('day', inplace=True)
-        return priority_slots
+        if self.available_day_bits is not None:
+            self.available_day_bits[booking_t] &= ~self.clinic_bits[clinic_id]
 
-    def create_slots(self, run_length, capacity_template):
+        if booking_t == self.next_free_day[clinic_id]:
+            next_t, _ = find_first_slot([self.available_slots_np],
+                                        booking_t + 1, clinic_id)
+            self.next_free_day[clinic_id] = \
+                len(self.available_slots_np) if next_t is None else next_t
 
-        priority_template = (capacity_template * self.prop_carve_out).round().astype(np.uint8)
-        open_template = capacity_template - priority_template
-        available_slots = open_template.copy()
+    def diary_to_df(self, diary):
+        '''
+        Return a copy of a diary as a DataFrame with a row per day
+        and a column per clinic.
 
-        #longer than run length as patients will need to book ahead
-        for day in range(int(run_length*1.5)):
-            available_slots = pd.concat([available_slots, open_template.copy()],
-                                         ignore_index=True)
+        Params:
+        ------
+        diary: np.ndarray
+            one of available_slots_np, carve_out_slots_np or bookings_np
+        '''
+        diary_df = pd.DataFrame(diary.copy(), columns=self.weekly_slots.columns)
+        diary_df.index.rename('day', inplace=True)
+        return diary_df
 
-        available_slots.index.rename('day', inplace=True)
-        return available_slots
+    def caseload_to_series(self):
+        '''
+        Return a copy of the current caseload of each clinician as a
+        Series labelled with the clinician names from the caseload file.
+        '''
+        return pd.Series(self.existing_caseload_np.copy(),
+                         index=self.caseload_clinicians,
+                         name='caseload')
 
-    def create_bookings(self, run_length, clinics):
-        bookings = np.zeros(shape=(5, clinics), dtype=np.uint8)
+    def create_carve_out(self, run_length, priority_template):
 
-        columns = [f'clinic_{i}' for i in range(1, clinics+1)]
-        bookings_template = pd.DataFrame(bookings, columns=columns)
+        #priority_template is the proportion of total capacity carved
+        #out for high priority patients (computed once in __init__)
 
-        bookings = bookings_template.copy()
+        #longer than run length as patients will need to book ahead
+        return np.tile(priority_template, (int(run_length*1.5) + 1, 1))
+
+    def create_slots(self, run_length, open_template):
 
         #longer than run length as patients will need to book ahead
-        for day in range(int(run_length*1.5)):
-            bookings = pd.concat([bookings, bookings_template.copy()],
-                                 ignore_index=True)
+        return np.tile(open_template, (int(run_length*1.5) + 1, 1))
 
-        bookings.index.rename('day', inplace=True)
-        return bookings
+    def create_bookings(self, run_length, clinics):
+
+        #longer than run length as patients will need to book ahead
+        return np.zeros(shape=(5 * (int(run_length*1.5) + 1), clinics), dtype=np.uint8)
 
 class LowPriorityPooledBooker():
     '''
@@ -293,6 +461,9 @@ class LowPriorityPooledBooker():
     Low priority patients only have access to public slots and have a minimum
     waiting time (e.g. 3 days before a slot can be used.)
     '''
+    #a booker is created for every patient so avoid a __dict__ each
+    __slots__ = ('args', 'min_wait', 'priority')
+
     def __init__(self, args):
         self.args = args
         self.min_wait = LOW_PRIORITY_MIN_WAIT
@@ -324,9 +495,6 @@ class LowPriorityPooledBooker():
         (best_t, best_clinic_id)
 
         '''
-        #to reduce runtime - drop down from pandas df to numpy...
-        available_slots_np = self.args.available_slots.to_numpy()
-
         #get the clinics that are pooled with this one.
 
         # Note that this is a leftover from when this model was clinic-level instead of
@@ -337,49 +505,93 @@ class LowPriorityPooledBooker():
         # might feel a bit strange - looking at ex_4_community will help you understand
         # why it's like this and why that option is very useful in other contexts.
         # In short - this works fine and it's not worth rewriting in this instance!
+        if limit_clinic_choice is None:
+            return self._find_slot_all_pooled(t, clinic_id)
+        return self._find_slot_masked(t, clinic_id, limit_clinic_choice)
 
-        if (limit_clinic_choice is not None) and (not any(limit_clinic_choice)):
-            raise AssertionError("Booking code triggered when no clinics have slots available - check prior logic")
-
-        # trace(self.args.pooling_np)
-        # trace(clinic_id)
-        # TODO: CONFIRM WHETHER ADDING IN -1 TO CLINIC ID HERE IS APPROPRIATE
-        clinic_options = np.where(self.args.pooling_np[clinic_id] == 1)[0]
-        trace(f"Clinic options: {clinic_options}")
+    def _find_slot_all_pooled(self, t, clinic_id):
+        '''
+        find_slot when there is no additional filtering. The pooled
+        clinics and their bits are looked up rather than recomputed.
+        '''
+        pool_bits = self.args.pool_bits
+        return self._search(t, self.args.pool_options[clinic_id],
+                            None if pool_bits is None else pool_bits[clinic_id])
 
-        # Then mask further by those with availability
+    def _find_slot_masked(self, t, clinic_id, limit_clinic_choice):
+        '''
+        find_slot when clinic choice is limited further by a mask.
+        '''
+        # Mask further by those with availability
         # The booking code should never be triggered if the total available
         # clinicians/clinics after limiting choice with this mask is an empty
         # array
-        if limit_clinic_choice is not None:
-            clinic_options = clinic_options[limit_clinic_choice]
+        if not np.any(limit_clinic_choice):
+            raise AssertionError("Booking code triggered when no clinics have slots available - check prior logic")
+
+        clinic_options = self.args.pool_options[clinic_id][limit_clinic_choice]
+        if TRACE:
             trace(f"Clinic options after additional filtering: {clinic_options}")
 
-        #get the clinic slots t+min_wait forward for the pooled clinics
-        clinic_slots = available_slots_np[t+self.min_wait:, clinic_options]
+        clinic_bits = None
+        if self.args.clinic_bits is not None:
+            clinic_bits = np.bitwise_or.reduce(self.args.clinic_bits[clinic_options])
+        return self._search(t, clinic_options, clinic_bits)
+
+    def _search(self, t, clinic_options, clinic_bits):
+        '''
+        Search the diary for the earliest day with a public slot at any
+        of clinic_options and choose between the clinics free that day.
+
+        Params:
+        ------
+        t: int,
+            time t in days
+
+        clinic_options: np.ndarray
+            ids of the clinics that can be booked
 
-        #get the earliest day number (its the name of the series)
-        best_t = np.where((clinic_slots.sum(axis=1) > 0))[0][0]
+        clinic_bits: np.uint64 or None
+            bits of clinic_options in args.available_day_bits.  None if
+            the diary is not bit-packed.
+
+        Returns:
+        -------
+        (int, int)
+        (best_t, best_clinic_id)
+        '''
+        available_slots_np = self.args.available_slots_np
+
+        #get the earliest day t+min_wait forward with a slot at any of the
+        #pooled clinics (no need to search before the first free day)
+        start = max(t+self.min_wait, self.args.next_free_day[clinic_options].min())
+        if clinic_bits is not None:
+            best_t = find_first_day(self.args.available_day_bits, start, clinic_bits)
+            day_slots = None if best_t is None else available_slots_np[best_t, clinic_options]
+        else:
+            best_t, day_slots = find_first_slot([available_slots_np],
+                                                start, clinic_options)
+
+        if best_t is None:
+            raise AssertionError("No slots available in the diary for the pooled clinics")
 
         #get the index of the best clinic option.
         # To ensure it's not always the first available clinician with availability
         # (as this can lead to odd behaviour with e.g. clinicians earlier in the list
         # getting all of the emergency patients when multiple clinicians have availability
         # on the same day)
-        clinic_sample = random.randint(0, len(clinic_options[clinic_slots[best_t, :] > 0])-1)
-
-        best_clinic_idx = clinic_options[clinic_slots[best_t, :] > 0][clinic_sample]
+        best_clinic_idx = self.args.clinic_choice_rng.choice(clinic_options[day_slots > 0])
 
         #return (best_t, booked_clinic_id)
-        return best_t + self.min_wait + t, best_clinic_idx
+        return best_t, best_clinic_idx
 
 
     def book_slot(self, booking_t, clinic_id):
         '''
         Book a slot on day t for clinic c
 
-        A slot is removed from args.available_slots
-        A appointment is recorded in args.bookings.iat
+        A slot is removed from args.available_slots_np
+        A appointment is recorded in args.bookings_np
 
         Params:
         ------
@@ -390,10 +602,10 @@ class LowPriorityPooledBooker():
             the clinic identifier
         '''
         #one less public available slot
-        self.args.available_slots.iat[booking_t, clinic_id] -= 1
+        self.args.remove_available_slot(booking_t, clinic_id)
 
         #one more patient waiting
-        self.args.bookings.iat[booking_t, clinic_id] += 1
+        self.args.bookings_np[booking_t, clinic_id] += 1
 class HighPriorityPooledBooker():
     '''
     High prioity booking process for POOLED clinics.
@@ -402,6 +614,9 @@ class HighPriorityPooledBooker():
     slots and have a minimum waiting time (e.g. 1 days before a
     slot can be used.)
     '''
+    #a booker is created for every patient so avoid a __dict__ each
+    __slots__ = ('args', 'min_wait', 'priority')
+
     def __init__(self, args):
         self.args = args
         self.min_wait = 1
@@ -434,44 +649,69 @@ class HighPriorityPooledBooker():
         (best_t, best_clinic_id)
 
         '''
-        #to reduce runtime - drop down to numpy...
-        available_slots_np = self.args.available_slots.to_numpy()
-        carve_out_slots_np = self.args.carve_out_slots.to_numpy()
-
         #get the clinics that are pooled with this one.
-        clinic_options = np.where(self.args.pooling_np[clinic_id] == 1)[0]
+        if limit_clinic_choice is None:
+            return self._find_slot_all_pooled(t, clinic_id)
+        return self._find_slot_masked(t, clinic_id, limit_clinic_choice)
+
+    def _find_slot_all_pooled(self, t, clinic_id):
+        '''
+        find_slot when there is no additional filtering.
+        '''
+        return self._search(t, self.args.pool_options[clinic_id])
+
+    def _find_slot_masked(self, t, clinic_id, limit_clinic_choice):
+        '''
+        find_slot when clinic choice is limited further by a mask.
+        '''
         # Then mask further by those with availability
-        clinic_options = clinic_options[limit_clinic_choice]
+        return self._search(t, self.args.pool_options[clinic_id][limit_clinic_choice])
 
-        #get the clinic slots t+min_wait forward for the pooled clinics
-        public_slots = available_slots_np[t+self.min_wait:, clinic_options]
-        priority_slots = carve_out_slots_np[t+self.min_wait:, clinic_options]
+    def _search(self, t, clinic_options):
+        '''
+        Search the diaries for the earliest day with a priority or public
+        slot at any of clinic_options and choose between the clinics free
+        that day.
 
-        #total slots
-        clinic_slots = priority_slots + public_slots
+        Params:
+        ------
+        t: int,
+            time t in days
 
-        #get the earliest day number (its the name of the series)
-        best_t = np.where((clinic_slots.sum(axis=1) > 0))[0][0]
+        clinic_options: np.ndarray
+            ids of the clinics that can be booked
+
+        Returns:
+        -------
+        (int, int)
+        (best_t, best_clinic_id)
+        '''
+        #get the earliest day t+min_wait forward with a slot (priority or
+        #public) at any of the pooled clinics
+        best_t, day_slots = find_first_slot([self.args.carve_out_slots_np,
+                                             self.args.available_slots_np],
+                                            t+self.min_wait, clinic_options)
+
+        if best_t is None:
+            raise AssertionError("No slots available in the diary for the pooled clinics")
 
         #get the index of the best clinic option.
         # To ensure it's not always the first available clinician with availability
         # (as this can lead to odd behaviour with e.g. clinicians earlier in the list
         # getting all of the emergency patients when multiple clinicians have availability
         # on the same day)
-        clinic_sample = random.randint(0, len(clinic_options[clinic_slots[best_t, :] > 0])-1)
-
-        best_clinic_idx = clinic_options[clinic_slots[best_t, :] > 0][clinic_sample]
+        best_clinic_idx = self.args.clinic_choice_rng.choice(clinic_options[day_slots > 0])
 
         #return (best_t, best_clinic_id)
-        return best_t + self.min_wait + t, best_clinic_idx
+        return best_t, best_clinic_idx
 
 
     def book_slot(self, booking_t, clinic_id):
         '''
         Book a slot on day t for clinic c
 
-        A slot is removed from args.available_slots
-        A appointment is recorded in args.bookings.iat
+        A slot is removed from args.available_slots_np
+        A appointment is recorded in args.bookings_np
 
         Params:
         ------
@@ -482,14 +722,14 @@ class HighPriorityPooledBooker():
             the clinic identifier
         '''
         #take carve out slot first
-        if self.args.carve_out_slots.iat[booking_t, clinic_id] > 0:
-            self.args.carve_out_slots.iat[booking_t, clinic_id] -= 1
+        if self.args.carve_out_slots_np[booking_t, clinic_id] > 0:
+            self.args.carve_out_slots_np[booking_t, clinic_id] -= 1
         else:
             #one less public available slot
-            self.args.available_slots.iat[booking_t, clinic_id] -= 1
+            self.args.remove_available_slot(booking_t, clinic_id)
 
         #one more booking...
-        self.args.bookings.iat[booking_t, clinic_id] += 1
+        self.args.bookings_np[booking_t, clinic_id] += 1
 
 class RepeatBooker():
     '''
@@ -501,6 +741,9 @@ class RepeatBooker():
     clinic_id: int
         the clinic identifier
     '''
+    #a booker is created for every patient with follow-ups
+    __slots__ = ('args', 'ideal_frequency', 'clinic_id', 'min_wait', 'priority')
+
     def __init__(self, args, ideal_frequency, clinic_id):
         self.args = args
         self.ideal_frequency = ideal_frequency
@@ -526,22 +769,26 @@ class RepeatBooker():
         (int, int)
         (best_t, best_clinic_id)
         '''
-        #to reduce runtime drop from pandas to numpy
-        available_slots_np = self.args.available_slots.to_numpy()
+        #get the earliest day t+min_wait forward with a slot at the clinic
+        #(no need to search before the first free day)
+        start = max(t+self.min_wait, self.args.next_free_day[self.clinic_id])
+        best_t, _ = find_first_slot([self.args.available_slots_np],
+                                    start, self.clinic_id)
 
-        #get the clinic slots t+min_wait forward for the pooled clinics
-        clinic_slots = available_slots_np[t+self.min_wait:, self.clinic_id]
+        #if the diary is full use the earliest day allowed
+        if best_t is None:
+            best_t = t + self.min_wait
 
         # return (best_t, best_clinic_id)
-        return np.argmax(clinic_slots > 0) + self.min_wait + t, self.clinic_id
+        return best_t, self.clinic_id
 
 
     def book_slot(self, booking_t):
         '''
         Book a slot on day t for clinic c
 
-        A slot is removed from args.available_slots
-        A appointment is recorded in args.bookings.iat
+        A slot is removed from args.available_slots_np
+        A appointment is recorded in args.bookings_np
 
         Params:
         ------
@@ -549,10 +796,10 @@ class RepeatBooker():
             Day of booking
         '''
         #one less public available slot
-        self.args.available_slots.iat[booking_t, self.clinic_id] -= 1
+        self.args.remove_available_slot(booking_t, self.clinic_id)
 
         #one more patient waiting
-        self.args.bookings.iat[booking_t, self.clinic_id] += 1
+        self.args.bookings_np[booking_t, self.clinic_id] += 1
 
 
 
@@ -565,18 +812,29 @@ class PatientReferral(object):
     Schedule an assessment for that day.
 
     '''
+    #there is one instance per referral so avoid a __dict__ per patient
+    __slots__ = ('env', 'args', 'referral_t', 'assessment_t', 'home_clinic',
+                 'booked_clinic', 'wait_list', 'booker', 'priority',
+                 'event_log', 'identifier', 'arrival_day',
+                 'arrival_order_within_day', 'arrival_number',
+                 'waiting_time', 'num_appts', 'follow_up_intensity')
+
     def __init__(self, env, args, referral_t, home_clinic,
                  booker, arrival_number,
-                 event_log, identifier, wait_store):
+                 event_log, identifier, wait_list):
         self.env = env
         self.args = args
         self.referral_t = referral_t
         self.assessment_t = None
-        self.home_clinic = home_clinic
-        self.booked_clinic = home_clinic
-        self.wait_store = wait_store
+        #clinic ids are held as python ints as they are written to
+        #every event and used to index the caseload on every update
+        self.home_clinic = int(home_clinic)
+        self.booked_clinic = self.home_clinic
+        self.wait_list = wait_list
 
         self.booker = booker
+        #priority of the patient booking (fixed by the booker)
+        self.priority = booker.priority
 
         self.event_log = event_log
         self.identifier = identifier
@@ -591,13 +849,6 @@ class PatientReferral(object):
 
         self.follow_up_intensity = None
 
-    @property
-    def priority(self):
-        '''
-        Return the priority of the patient booking
-        '''
-        return self.booker.priority
-
     def execute_referral(self):
         '''
         Patient is referred to clinic
@@ -611,7 +862,7 @@ class PatientReferral(object):
              'pathway': self.priority,
              'event_type': 'arrival_departure',
              'event': 'arrival',
-             'home_clinic': int(self.home_clinic),
+             'home_clinic': self.home_clinic,
              'time': self.env.now}
         )
 
@@ -620,7 +871,7 @@ class PatientReferral(object):
         #         'pathway': self.priority,
         #         'event_type': 'queue',
         #         'event': 'waiting_appointment_to_be_scheduled',
-        #         'home_clinic': int(self.home_clinic),
+        #         'home_clinic': self.home_clinic,
         #         'time': self.env.now
         #         }
         #     )
@@ -637,14 +888,16 @@ class PatientReferral(object):
         # This is to try and prevent the books becoming overfull, leading to gaps that are too long
         # between regular appointments
         if self.priority == 1:
-            # PUT THEM IN THE STORE AND GO TO THE NEXT PROCESS
-            trace(f"Standard Referral {self.identifier} - Putting into referral queue")
+            # PUT THEM ON THE WAIT LIST AND GO TO THE NEXT PROCESS
+            if TRACE:
+                trace(f"Standard Referral {self.identifier} - Putting into referral queue")
 
-            # Priority queue doesn't have order stability within priorities, so important to set priority
+            # The wait list is a heap of (priority, arrival number, patient) tuples.
+            # Heaps don't have order stability within priorities, so important to set priority
             # in such a way that everyone has their own distinct priority that will put them in the correct point
-            # in the queue
-            self.wait_store.put(PrioritizedItem(self.arrival_number+1000000, self), block=False)
-            # Once they are in the store, the simulation will check once every day how many people can be taken
+            # in the queue (the arrival number also breaks any ties before the patient is compared)
+            heapq.heappush(self.wait_list, (self.arrival_number+1000000, self.arrival_number, self))
+            # Once they are on the wait list, the simulation will check once every day how many people can be taken
             # out of the store and booked in for their assessment and ongoing regular appointments
 
         #########################
@@ -653,18 +906,19 @@ class PatientReferral(object):
 
         # If priority is high, put to front of referral queue
         if self.priority == 2:
-            # PUT THEM IN THE STORE AND GO TO THE NEXT PROCESS
-            trace(f"Urgent Referral {self.identifier} - Putting to front of referral queue")
+            # PUT THEM ON THE WAIT LIST AND GO TO THE NEXT PROCESS
+            if TRACE:
+                trace(f"Urgent Referral {self.identifier} - Putting to front of referral queue")
             # Lower numbers go to the front of the queue
-            self.wait_store.put(PrioritizedItem(self.arrival_number, self), block=False)
+            heapq.heappush(self.wait_list, (self.arrival_number, self.arrival_number, self))
 
         self.event_log.append(
                 {'patient': self.identifier,
                 'pathway': self.priority,
                 'event_type': 'queue',
                 'event': 'waiting_appointment_to_be_scheduled',
-                'booked_clinic': int(self.booked_clinic),
-                'home_clinic': int(self.home_clinic),
+                'booked_clinic': self.booked_clinic,
+                'home_clinic': self.home_clinic,
                 'time': self.env.now
                 }
             )
@@ -672,26 +926,18 @@ class PatientReferral(object):
     def execute_assessment_booking(self):
 
         def get_available_clinicians():
-            # First calculate each clinician's theoretical maximum from the slots file
+            # First get each clinician's theoretical maximum from the slots file
             # TODO: Consdier whether to floor
-            caseload_slots_per_clinician = np.floor((self.args.weekly_slots).sum().to_numpy().T * self.args.caseload_multiplier)
-            trace(f"Adjusted slots: {caseload_slots_per_clinician}")
-            # caseload_slots_per_clinician = (self.args.weekly_slots).sum().to_numpy().T
-            # Then we subtract one from the other to get the available slots
-            # Then subtract one from the theoretical maximum because we want to leave headroom
-            # for emergency clients
-            # available_caseload = (
-            #     caseload_slots_per_clinician - self.args.existing_caseload.tolist()[1:]
-            #     )- 1
+            caseload_slots_per_clinician = self.args.caseload_slots_per_clinician
+            if TRACE:
+                trace(f"Adjusted slots: {caseload_slots_per_clinician}")
+            # Then we subtract the existing caseload to get the available slots
             available_caseload = (
-                caseload_slots_per_clinician - self.args.existing_caseload.tolist()[1:]
+                caseload_slots_per_clinician
+                - self.args.existing_caseload_np
                 )
-            # print(f"Checking available clinicians when booking assessment appointment. " \
-            #       f"Caseload slots available: {sum([c if c>0 else 0 for c in available_caseload])} ({available_caseload})")
-            # trace(f"Total theoretical caseload: {caseload_slots_per_clinician}")
-            # print(f"Total current caseload per clinician: {self.args.existing_caseload.tolist()[1:]}")
-            clinicians_with_slots = [True if c >= 0.5 else False for c in available_caseload]
-            return clinicians_with_slots
+            # boolean mask of clinicians with at least half a caseload slot free
+            return available_caseload >= 0.5
 
         #get slot for clinic
         if self.priority == 2:
@@ -702,7 +948,8 @@ class PatientReferral(object):
         # if non-urgent, we will have previously checked that there is some availability
         else:
             got_slots = get_available_clinicians()
-            trace(f"Clinicians with slots for patient {self.identifier}: {got_slots}")
+            if TRACE:
+                trace(f"Clinicians with slots for patient {self.identifier}: {got_slots}")
             self.assessment_t, self.booked_clinic = self.booker.find_slot(
                 self.env.now, self.home_clinic,
                 # Limit clinic choice here to clinicians with capacity
@@ -710,23 +957,26 @@ class PatientReferral(object):
                 )
             # self.booker.find_slot(self.referral_t, self.home_clinic)
 
+        #python int once rather than int() at every event/caseload update
+        self.booked_clinic = int(self.booked_clinic)
 
         #book slot at clinic = time of referral + waiting_time
         self.booker.book_slot(self.assessment_t, self.booked_clinic)
 
-        trace(f"client {self.identifier} (priority: {self.priority}): referred on" \
-              f" {self.referral_t}, seized booking with clinician {self.booked_clinic}" \
-              f" on day {self.assessment_t} at day {self.env.now}" \
-              f" (Assessment wait: {self.assessment_t - self.env.now} days," \
-              f" booking wait {(self.env.now - self.referral_t)} days)")
+        if TRACE:
+            trace(f"client {self.identifier} (priority: {self.priority}): referred on" \
+                  f" {self.referral_t}, seized booking with clinician {self.booked_clinic}" \
+                  f" on day {self.assessment_t} at day {self.env.now}" \
+                  f" (Assessment wait: {self.assessment_t - self.env.now} days," \
+                  f" booking wait {(self.env.now - self.referral_t)} days)")
 
         self.event_log.append(
             {'patient': self.identifier,
             'pathway': self.priority,
             'event_type': 'queue',
             'event': 'appointment_booked_waiting',
-            'booked_clinic': int(self.booked_clinic),
-            'home_clinic': int(self.home_clinic),
+            'booked_clinic': self.booked_clinic,
+            'home_clinic': self.home_clinic,
             'time': self.env.now,
             'assessment_booking_wait': (self.env.now - self.referral_t)
             }
@@ -738,14 +988,15 @@ class PatientReferral(object):
         # caseload accordingly - we can always adjust that if they are deemed to be low
         # frequency after their assessment appointment
         if self.priority == 2:
-            self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] += 1
+            self.args.existing_caseload_np[self.booked_clinic] += 1
          # If they are low priority chances are they'll be low intensity, so adjust
         # the booked clinician's available caseload figures accordingly
         elif self.priority == 1:
-            self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] += 0.5
+            self.args.existing_caseload_np[self.booked_clinic] += 0.5
         else:
-            trace(f"Error - unknown priority value passed for patient {self.identifier}" \
-                  f" ({self.priority})")
+            if TRACE:
+                trace(f"Error - unknown priority value passed for patient {self.identifier}" \
+                      f" ({self.priority})")
 
         # Pass client to process where they will wait for the assessment appointment
         # to take place
@@ -767,8 +1018,8 @@ class PatientReferral(object):
             'pathway': self.priority,
             'event_type': 'queue',
             'event': 'have_appointment',
-            'booked_clinic': int(self.booked_clinic),
-            'home_clinic': int(self.home_clinic),
+            'booked_clinic': self.booked_clinic,
+            'home_clinic': self.home_clinic,
             'type': "assessment",
             'time': self.env.now,
             'wait': self.waiting_time
@@ -784,12 +1035,13 @@ class PatientReferral(object):
         # First sample whether they will have any follow-up appointments
         # Low priority likely to be low intensity
         # High priority likely to be high intensity
-        if int(self.priority) == 1: # low priority
+        if self.priority == 1: # low priority
             follow_up_y = self.args.follow_up_dist_low_priority.sample()
-        elif int(self.priority) == 2: # high priority
+        elif self.priority == 2: # high priority
             follow_up_y = self.args.follow_up_dist_high_priority.sample()
         else:
-            trace(f"Error - Unknown priority value received ({self.priority})")
+            if TRACE:
+                trace(f"Error - Unknown priority value received ({self.priority})")
 
         # If they don't have follow-up appointments we can remove them
         # from the caseload and they'll exit the system
@@ -798,48 +1050,52 @@ class PatientReferral(object):
         # (high priority = probably high intensity = 1 caseload slot)
         # (low priority = probably low intensity = 0.5 caseload slots)
         if not follow_up_y:
-            trace(f"Client {self.identifier} (priority: {self.priority})" \
-                  f" assessed as not needing ongoing service")
+            if TRACE:
+                trace(f"Client {self.identifier} (priority: {self.priority})" \
+                      f" assessed as not needing ongoing service")
             self.event_log.append(
                 {'patient': self.identifier,
                 'pathway': self.priority,
                 'event_type': 'arrival_departure',
                 'event': 'depart',
-                'home_clinic': int(self.home_clinic),
+                'home_clinic': self.home_clinic,
                 'time': self.env.now+1}
             )
-            # print(f"Patient {self.identifier} (priority: {self.priority}) departs after assessments without follow-ups")
+            if TRACE:
+                trace(f"Patient {self.identifier} (priority: {self.priority}) departs after assessments without follow-ups")
             # If assessed as not needing ongoing service, we can reduce the clinician's caseload
             # which will have at this point been set based on their most likely follow-up intensity
             # (weekly for high intensity so 1 slot, fortnightly for low intensity so 0.5 slots)
             if self.priority == 2: # high
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] -= 1
+                self.args.existing_caseload_np[self.booked_clinic] -= 1
             else: # low
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] -= 0.5
+                self.args.existing_caseload_np[self.booked_clinic] -= 0.5
 
         # If they do have follow-up appointments
         # Sample whether they will need high-intensity follow-up
         # (every 7 days) or low-intensity follow-up (every 21 days)
         else:
-            if int(self.priority) == 1: # low
+            if self.priority == 1: # low
                 self.follow_up_intensity = self.args.intensity_dist_low_priority.sample()
-            elif int(self.priority) == 2: # high
+            elif self.priority == 2: # high
                 self.follow_up_intensity = self.args.intensity_dist_high_priority.sample()
             else:
-                trace(f"Error - Unknown priority value received ({self.priority})")
+                if TRACE:
+                    trace(f"Error - Unknown priority value received ({self.priority})")
             # Output of this:
             # we count 0 as a low intensity follow-up
             # we count 1 as a high intensity follow-up
+            intensity_label = _INTENSITY_STR[self.follow_up_intensity]
 
             # Adjust caseload values if expected pathway not followed
             # if high priority has low intensity follow up then we need to reduce the
             # number of caseload slots they are using from 1 to 0.5:
-            if self.follow_up_intensity == 0 and int(self.priority) == 2:
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] -= 0.5
+            if self.follow_up_intensity == 0 and self.priority == 2:
+                self.args.existing_caseload_np[self.booked_clinic] -= 0.5
             # if low priority has high intensity follow up then we need to up
             # the number of caseload slots they are using from 0.5 to 1:
-            elif self.follow_up_intensity == 1 and int(self.priority) == 1:
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] += 0.5
+            elif self.follow_up_intensity == 1 and self.priority == 1:
+                self.args.existing_caseload_np[self.booked_clinic] += 0.5
             # Otherwise caseload remains as it was set initially when they were booked in
             # for assessment
             else:
@@ -848,21 +1104,19 @@ class PatientReferral(object):
             # Now sample how many follow-up appointments they need
             if self.follow_up_intensity == 1: # high-intensity follow-up
                 num_appts = int(self.args.num_follow_up_dist_high_intensity.sample())
-                repeat_booker = RepeatBooker(
-                    ideal_frequency=HIGH_INTENSITY_FOLLOW_UP_TARGET_INTERVAL,
-                    args = self.args,
-                    clinic_id=self.booked_clinic)
             else: # low-intensity follow-up
                 num_appts = int(self.args.num_follow_up_dist_low_intensity.sample())
-                repeat_booker = RepeatBooker(
-                    args = self.args,
-                    ideal_frequency=LOW_INTENSITY_FOLLOW_UP_TARGET_INTERVAL,
-                    clinic_id=self.booked_clinic)
+
+            repeat_booker = RepeatBooker(
+                args = self.args,
+                ideal_frequency=_INTENSITY_INTERVAL[self.follow_up_intensity],
+                clinic_id=self.booked_clinic)
 
             self.num_appts = num_appts
 
-            trace(f"Client {self.identifier} (priority: {self.priority}) assessed as needing" \
-                  f" {num_appts} appointments at intensity {self.follow_up_intensity}")
+            if TRACE:
+                trace(f"Client {self.identifier} (priority: {self.priority}) assessed as needing" \
+                      f" {num_appts} appointments at intensity {self.follow_up_intensity}")
 
             # Now we know how many appointments they will have over the total duration
             # of their interaction with the service, we can enter a loop of booking in
@@ -878,69 +1132,62 @@ class PatientReferral(object):
             # to then reflect the historical (or desired) spread of the number of follow-up
             # appointments people in our system have
 
+            #fields shared by every follow-up event for this patient
+            log_values = self.event_log.append_values
+            header = {'patient': self.identifier,
+                      'pathway': self.priority,
+                      'booked_clinic': self.booked_clinic,
+                      'home_clinic': self.home_clinic}
+
+            #local names for the attributes used on every appointment
+            env = self.env
+            timeout = env.timeout
+            find_slot = repeat_booker.find_slot
+            book_slot = repeat_booker.book_slot
+
             for i in range(num_appts):
-                best_t, clinic = \
-                    repeat_booker.find_slot(self.env.now)
+                now = env.now
+                best_t, clinic = find_slot(now)
 
                 #book slot at clinic = time of referral + waiting_time
-                repeat_booker.book_slot(best_t)
-
-                self.event_log.append(
-                    {'patient': self.identifier,
-                    'pathway': self.priority,
-                    'event_type': 'queue',
-                    'event': 'follow_up_appointment_booked_waiting',
-                    'booked_clinic': int(self.booked_clinic),
-                    'home_clinic': int(self.home_clinic),
-                    'follow_up': i,
-                    'follow_up_intensity': 'high' if self.follow_up_intensity == 1 else 'low',
-                    'follow_ups_intended': num_appts,
-                    # plus one to ensure this doesn't end up preventing them from actually being
-                    # at the appointment at some point
-                    'time': self.env.now + 1,
-                    'true_time': self.env.now
-                    }
+                book_slot(best_t)
+
+                log_values(
+                    _BOOKED_KEYS,
+                    ('queue', 'follow_up_appointment_booked_waiting', i,
+                     intensity_label, num_appts,
+                     # plus one to ensure this doesn't end up preventing them from actually being
+                     # at the appointment at some point
+                     now + 1, now),
+                    header
                 )
 
-                interval = best_t - self.env.now
+                interval = best_t - now
 
                 #wait for appointment
-                yield self.env.timeout(best_t - self.env.now)
+                yield timeout(interval)
 
                 # Use appointment
-                self.event_log.append(
-                    {'patient': self.identifier,
-                    'pathway': self.priority,
-                    'event_type': 'queue',
-                    'event': 'have_appointment',
-                    'booked_clinic': int(self.booked_clinic),
-                    'home_clinic': int(self.home_clinic),
-                    'time': self.env.now,
-                    'type': "follow-up",
-                    'follow_up': i,
-                    'follow_up_intensity': 'high' if self.follow_up_intensity == 1 else 'low',
-                    'follow_ups_intended': num_appts,
-                    'interval': interval
-                    }
+                log_values(
+                    _APPOINTMENT_KEYS,
+                    ('queue', 'have_appointment', env.now, "follow-up", i,
+                     intensity_label, num_appts, interval),
+                    header
                 )
 
-                i += 1
-
                 # Repeat this loop until all predefined appointments have taken place
 
             # Once they reach this part of the code, they are leaving the system, so can
             # be removed from the caseload file
-            if self.follow_up_intensity == 1: # high intensity
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] -= 1
-            elif self.follow_up_intensity == 0: # low intensity
-                self.args.existing_caseload[1:].iloc[int(self.booked_clinic)] -= 0.5
+            self.args.existing_caseload_np[self.booked_clinic] -= \
+                _INTENSITY_SLOT[self.follow_up_intensity]
 
             self.event_log.append(
                 {'patient': self.identifier,
                 'pathway': self.priority,
                 'event_type': 'arrival_departure',
                 'event': 'depart',
-                'home_clinic': int(self.home_clinic),
+                'home_clinic': self.home_clinic,
                 # Add 1 so that when displaying we don't prioritise departure above
                 # displaying as being at an appointment (else they happen effectively
                 # at the same time and this may be selected as most recent activity
@@ -949,7 +1196,8 @@ class PatientReferral(object):
                 'true_time': self.env.now
                 }
             )
-            # print(f"Patient {self.identifier} (intensity: {self.follow_up_intensity}) departs after {num_appts} follow-ups complete")
+            if TRACE:
+                trace(f"Patient {self.identifier} (intensity: {self.follow_up_intensity}) departs after {num_appts} follow-ups complete")
 
 class AssessmentReferralModel(object):
     '''
@@ -1016,10 +1264,18 @@ class AssessmentReferralModel(object):
         #list of patients referral processes
         self.referrals = []
 
-        self.event_log = []
+        #column oriented log of events for the animation.
+        #columns with a small set of repeated strings are dictionary encoded
+        self.event_log = EventLog(encode=('pathway', 'event_type', 'event',
+                                          'type', 'follow_up_intensity'))
 
-        self.daily_caseload_snapshots = []
-        self.daily_waiting_for_booking_snapshots = []
+        #end of day caseload and booking queue size (row per day).
+        #converted to DataFrames in process_run_results
+        n_days = int(self.args.run_length) + 1
+        self.caseload_snapshots_np = np.empty((n_days, len(self.args.existing_caseload_np)),
+                                              dtype=np.float64)
+        self.booking_queue_snapshots_np = np.empty(n_days, dtype=np.int64)
+        self.n_snapshot_days = 0
 
         self.init_resources()
 
@@ -1029,11 +1285,13 @@ class AssessmentReferralModel(object):
 
     def init_resources(self):
         """
-        Create a store we can keep patients in while we wait for there
-        to be capacity on a clinician's caseload
+        Create a wait list we can keep patients in while we wait for there
+        to be capacity on a clinician's caseload.
+
+        The model is single threaded so a plain list managed with heapq
+        is used as the priority queue.
         """
-        # self.args.waiting_for_clinician_store = simpy.Store(self.env)
-        self.args.waiting_for_clinician_store = queue.PriorityQueue()
+        self.args.waiting_for_clinician_list = []
 
     def run(self):
         '''
@@ -1056,38 +1314,39 @@ class AssessmentReferralModel(object):
         '''
         #loop a day at a time.
         total_arrivals = 0
+        log_events = self.event_log.extend
+
+        #total number of referrals on each day of the run
+        #(env.run stops the model at run_length)
+        n_days = int(self.args.run_length) + 1
+        daily_referrals = self.args.arrival_dist.sample(size=n_days).tolist()
 
-        for t in itertools.count():
-            # print("##################")
-            # print(f"# Day {t}")
-            # print("##################")
-            #total number of referrals today
-            n_referrals = self.args.arrival_dist.sample()
-            # print(f"{n_referrals} patients arrive in system")
+        for t, n_referrals in enumerate(daily_referrals):
+            if TRACE:
+                trace("##################")
+                trace(f"# Day {t}")
+                trace("##################")
+                trace(f"{n_referrals} patients arrive in system")
+
+            #sample clinics, triage and priority for all of today's referrals
+            clinic_ids, referred_out, high_priority = self.triage_referrals(n_referrals)
 
             #loop through all referrals recieved that day
             for i in range(n_referrals):
 
                 total_arrivals += (i+1) # plus one as will start at 0
 
-                #sample clinic based on empirical proportions
-                # hangover from model this was based on - this effectively doesn't matter here
-                # as the pooling is set for clients to then be able to book in with *any* clinician
-                # for their initial appointment
+                # home clinic is a hangover from model this was based on - this effectively
+                # doesn't matter here as the pooling is set for clients to then be able to
+                # book in with *any* clinician for their initial appointment
                 # however, as doesn't have a negative impact, not worth removing!
-                clinic_id = self.args.clinic_dist.sample()
-                clinic = self.args.clinics[clinic_id]
-
-                #triage patient and refer out of system if appropraite
-                referred_out = clinic.ref_out_dist.sample()
+                clinic_id = clinic_ids[i]
 
                 #if patient is accepted to clinic
-                if referred_out == 0:
+                if referred_out[i] == 0:
 
                     #is patient high priority?
-                    high_priority = self.args.priority_dist.sample()
-
-                    if high_priority == 1:
+                    if high_priority[i] == 1:
                         assessment_booker = HighPriorityPooledBooker(self.args)
                     else:
                         assessment_booker = LowPriorityPooledBooker(self.args)
@@ -1101,7 +1360,7 @@ class AssessmentReferralModel(object):
                                               event_log=self.event_log,
                                               identifier=f"{t}_{i}",
                                               arrival_number=total_arrivals,
-                                              wait_store=self.args.waiting_for_clinician_store)
+                                              wait_list=self.args.waiting_for_clinician_list)
 
                     #start a referral assessment process for patient.
                     # self.env.process(patient.execute_referral())
@@ -1113,59 +1372,83 @@ class AssessmentReferralModel(object):
                         self.referrals.append(patient)
 
                 # Add event logging for patients triaged and referred out
-                if referred_out == 1:
-                    self.event_log.append(
-                        {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'arrival_departure',
-                        'event': 'arrival',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now
-                        }
-                    )
-                    trace(f"Client {t}_{i} categorised as inappropriate referral - rejected")
-
-                    self.event_log.append(
+                if referred_out[i] == 1:
+                    if TRACE:
+                        trace(f"Client {t}_{i} categorised as inappropriate referral - rejected")
+
+                    log_events(
+                        ({'event_type': 'arrival_departure',
+                          'event': 'arrival',
+                          'home_clinic': clinic_id,
+                          'time': self.env.now},
+                         {'event_type': 'queue',
+                          'event': 'referred_out',
+                          'home_clinic': clinic_id,
+                          'time': self.env.now},
+                         {'event_type': 'arrival_departure',
+                          'event': 'depart',
+                          'home_clinic': clinic_id,
+                          'time': self.env.now + 1}),
                         {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'queue',
-                        'event': 'referred_out',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now
-                        }
+                         'pathway': "Unsuitable for service"}
                     )
-
-                    self.event_log.append(
-                        {'patient': f"{t}_{i}",
-                        'pathway': "Unsuitable for service",
-                        'event_type': 'arrival_departure',
-                        'event': 'depart',
-                        'home_clinic': int(clinic_id),
-                        'time': self.env.now + 1
-                        }
-                    )
-                    # print(f"Patient {t}_{i} discharged before assessment as unsuitable for service")
+                    if TRACE:
+                        trace(f"Patient {t}_{i} discharged before assessment as unsuitable for service")
 
             # Finish iterating per patient
 
             # Move onto processes that will be triggered once per day
-            trace(f"Triggering assessment booking process on day {self.env.now}")
+            if TRACE:
+                trace(f"Triggering assessment booking process on day {self.env.now}")
             self.env.process(self.book_new_clients_if_capacity())
 
             # Record the daily caseload after all patients booked in
-            # caseload_slots_per_clinician = (self.args.weekly_slots).sum().to_numpy().T
-            self.daily_caseload_snapshots.append(
-                {'day': t, 'caseload_day_end': self.args.existing_caseload.tolist()[1:]}
-                )
-
-            self.daily_waiting_for_booking_snapshots.append(
-                {'day': t, 'booking_queue_size_day_end': self.args.waiting_for_clinician_store.qsize()}
-                )
+            self.caseload_snapshots_np[t] = self.args.existing_caseload_np
+            self.booking_queue_snapshots_np[t] = len(self.args.waiting_for_clinician_list)
+            self.n_snapshot_days = t + 1
             #timestep by one day
             yield self.env.timeout(1)
 
+    def triage_referrals(self, n_referrals):
+        '''
+        Sample the home clinic, triage outcome and priority of a day of
+        referrals.
+
+        The distributions are Buffered so numpy is already called in
+        large batches.  Days only have a handful of referrals, so the
+        samples are handed out as lists, which are quicker to build
+        and index than small arrays.
+
+        Params:
+        ------
+        n_referrals: int
+            number of referrals recieved that day
+
+        Returns:
+        -------
+        (list, list, list)
+        (clinic_ids, referred_out, high_priority).  referred_out is 1 if
+        the patient is referred to another service and high_priority is
+        only sampled for patients accepted by a clinic (0 otherwise)
+        '''
+        #sample clinic based on empirical proportions
+        clinic_ids = self.args.clinic_dist.sample(size=n_referrals).tolist()
+
+        #triage patients and refer out of system if appropraite.
+        clinics = self.args.clinics
+        referred_out = [clinics[clinic_id].ref_out_dist.sample()
+                        for clinic_id in clinic_ids]
+
+        #priority of the patients accepted by a clinic
+        priority_dist = self.args.priority_dist
+        high_priority = [0 if ref_out else priority_dist.sample()
+                         for ref_out in referred_out]
+
+        return clinic_ids, referred_out, high_priority
+
     def book_new_clients_if_capacity(self):
-        trace(f"Initial check of clinician caseload on day {self.env.now}")
+        if TRACE:
+            trace(f"Initial check of clinician caseload on day {self.env.now}")
         # Check whether there is any capacity for new patients to be added to the
         # caseload of the clinicians
         # (i.e. have any of their existing clients had their final appointment since yesterday,
@@ -1201,28 +1484,36 @@ class AssessmentReferralModel(object):
         # What we need to check is the number of people currently booked for assessment
         # or on the books with each clinician
 
-        # this is stored in self.args.existing_caseload
+        # this is stored in self.args.existing_caseload_np
+
+        # Available caseload is recalculated into this array on each check.
+        # It can't be updated incrementally from the bookings made here as
+        # the caseload also changes (e.g. departures) while waiting for each
+        # booking process to complete.
+        available_caseload = np.empty_like(self.args.caseload_slots_per_clinician)
 
         def check_for_availability():
-            # Then we calculate their theoretical maximum from the slots file
+            # Then we get their theoretical maximum from the slots file
+            # (calculated once in Scenario as it does not change during a run)
              # TODO: Consdier whether to floor
-            caseload_slots_per_clinician = np.floor((self.args.weekly_slots).sum().to_numpy().T * self.args.caseload_multiplier)
-            trace(f"Adjusted slots: {caseload_slots_per_clinician}")
+            caseload_slots_per_clinician = self.args.caseload_slots_per_clinician
+            if TRACE:
+                trace(f"Adjusted slots: {caseload_slots_per_clinician}")
             # caseload_slots_per_clinician = (self.args.weekly_slots).sum().to_numpy().T
             # Then we subtract one from the other to get the available slots
             # Then subtract one from the theoretical maximum because we want to leave headroom
             # for emergency clients
             # available_caseload = (caseload_slots_per_clinician - self.args.existing_caseload.tolist()[1:]) -1
-            available_caseload = (caseload_slots_per_clinician - self.args.existing_caseload.tolist()[1:])
-            clinicians_with_slots = len([c for c in available_caseload if c >= 0.5])
-            return clinicians_with_slots, available_caseload
+            np.subtract(caseload_slots_per_clinician, self.args.existing_caseload_np,
+                        out=available_caseload)
+            return available_caseload
 
         # Do an initial check for if anyone has capacity
         # and if they do, check who has the soonest appointment
         # If no-one has capacity, time out and wait until tomorrow instead
         # when a fresh check will be done.
         # clinicians_with_slots, available_caseload = check_for_availability()
-        # trace(f"Current caseload distribution: {self.args.existing_caseload.tolist()[1:]}")
+        # trace(f"Current caseload distribution: {self.args.existing_caseload_np.tolist()}")
         # trace(f"Initial availability on day {self.env.now}: {clinicians_with_slots} " \
         #       f"clinicians with {available_caseload.sum()} total caseload slots ({available_caseload})")
 
@@ -1233,21 +1524,28 @@ class AssessmentReferralModel(object):
         # (so e.g. if a high intensity patient has just left the system, then you
         # can book 2 likely-to-be-low intensity patients in their place)
 
+        # heap of (priority, arrival number, patient) tuples - see init_resources
+        wait_list = self.args.waiting_for_clinician_list
+
         # Continue looping while there are people waiting to be booked
-        while self.args.waiting_for_clinician_store.qsize() > 0:
-            clinicians_with_slots, available_caseload = check_for_availability()
+        while wait_list:
+            check_for_availability()
             # if there are any available slots, proceed, else break loop entirely
             # as if this is the case, we can't make any more bookings today
-            cl_count = sum([c if c>0 else 0 for c in available_caseload])
-            trace(f"Available caseload is {cl_count}")
-            if cl_count < 0.5:
-                trace("Exiting loop position 1")
+            # (caseload moves in steps of 0.5 so this is the same as the total
+            # positive available caseload being at least 0.5)
+            if TRACE:
+                trace(f"Available caseload is {np.clip(available_caseload, 0, None).sum()}")
+            if available_caseload.max() < 0.5:
+                if TRACE:
+                    trace("Exiting loop position 1")
                 break
 
-            # print(f"{self.args.waiting_for_clinician_store.qsize()} patients still waiting to be booked in")
+            if TRACE:
+                trace(f"{len(wait_list)} patients still waiting to be booked in")
 
             # Get someone out of the store of patients waiting for bookings
-            patient_front_of_wl = self.args.waiting_for_clinician_store.get().item
+            _, _, patient_front_of_wl = heapq.heappop(wait_list)
             # Check whether they
             # You could do this differently here if you had multiple priority
             # levels within the store
@@ -1256,7 +1554,8 @@ class AssessmentReferralModel(object):
             # (as they wouldn't overload that clinician)
             # But here we just have low priority patients in our store because any
             # high priority patients have gone straight to being booked in
-            # print(f"Patient {patient_front_of_wl.identifier} (priority: {patient_front_of_wl.priority}) removed from store")
+            if TRACE:
+                trace(f"Patient {patient_front_of_wl.identifier} (priority: {patient_front_of_wl.priority}) removed from store")
             yield self.env.process(patient_front_of_wl.execute_assessment_booking())
             # trace(f"Assessment booking process complete for patient {patient_front_of_wl.identifier}")
 
@@ -1281,7 +1580,8 @@ class AssessmentReferralModel(object):
                 # # will be brought out and be booked in
                 # clinicians_with_slots, available_caseload = check_for_availability()
         else:
-            trace(f"No further slots available for booking on day {self.env.now}")
+            if TRACE:
+                trace(f"No further slots available for booking on day {self.env.now}")
 
 
 
@@ -1290,21 +1590,29 @@ class AssessmentReferralModel(object):
         Produce summary results split by priority...
         '''
 
-        trace(f"{len(self.referrals)} patients in total")
-        trace(f"{[p.priority for p in self.referrals]}")
+        if TRACE:
+            trace(f"{len(self.referrals)} patients in total")
+            trace(f"{[p.priority for p in self.referrals]}")
+
+        #waiting time (NaN if no appointment yet) and priority of each referral
+        waiting_times = np.array(list(map(attrgetter('waiting_time'), self.referrals)),
+                                 dtype=np.float64)
+        priorities = np.fromiter(map(attrgetter('priority'), self.referrals),
+                                 dtype=np.int8, count=len(self.referrals))
 
-        results_all = [p.waiting_time for p in self.referrals
-               if not p.waiting_time is None]
-        trace(f"Results all - len {len(results_all)}")
+        seen = ~np.isnan(waiting_times)
 
-        results_low = [p.waiting_time for p in self.referrals
-                       if not (p.waiting_time is None) and p.priority == 1]
-        trace(f"Results low - len {len(results_low)}")
+        results_all = waiting_times[seen].tolist()
+        if TRACE:
+            trace(f"Results all - len {len(results_all)}")
 
-        results_high = [p.waiting_time for p in self.referrals
-                       if (not p.waiting_time is None) and p.priority == 2]
+        results_low = waiting_times[seen & (priorities == 1)].tolist()
+        if TRACE:
+            trace(f"Results low - len {len(results_low)}")
 
-        trace(f"Results high - len {len(results_high)}")
+        results_high = waiting_times[seen & (priorities == 2)].tolist()
+        if TRACE:
+            trace(f"Results high - len {len(results_high)}")
 
         results_arrivals = [p.arrival_day for p in self.referrals]
 
@@ -1312,8 +1620,16 @@ class AssessmentReferralModel(object):
         self.results_low = results_low
         self.results_high = results_high
 
-        self.bookings = self.args.bookings
-        self.available_slots = self.args.available_slots
-        self.daily_caseload_snapshots = pd.DataFrame(self.daily_caseload_snapshots)
-        self.daily_waiting_for_booking_snapshots = pd.DataFrame(self.daily_waiting_for_booking_snapshots)
+        self.bookings = self.args.diary_to_df(self.args.bookings_np)
+        self.available_slots = self.args.diary_to_df(self.args.available_slots_np)
+        self.final_caseload = self.args.caseload_to_series()
+        days = np.arange(self.n_snapshot_days)
+        self.daily_caseload_snapshots = pd.DataFrame(
+            {'day': days,
+             'caseload_day_end': list(self.caseload_snapshots_np[:self.n_snapshot_days])}
+            )
+        self.daily_waiting_for_booking_snapshots = pd.DataFrame(
+            {'day': days,
+             'booking_queue_size_day_end': self.booking_queue_snapshots_np[:self.n_snapshot_days]}
+            )
         self.results_daily_arrivals = results_arrivals
@@ -1,4 +1,8 @@
-from examples.ex_5_community_follow_up.model_classes import AssessmentReferralModel
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from examples.ex_5_community_follow_up.model_classes import AssessmentReferralModel, \
+    Scenario, generate_seed_vector
 
 def single_run(args, rep=0):
     '''
@@ -8,4 +12,88 @@ def single_run(args, rep=0):
     model.run()
     model.process_run_results()
 
-    return model.results_all, model.results_low, model.results_high, model.event_log, model.bookings, model.available_slots, model.daily_caseload_snapshots, model.daily_waiting_for_booking_snapshots, model.results_daily_arrivals
+    return model.results_all, model.results_low, model.results_high, model.event_log.to_dataframe(), model.bookings, model.available_slots, model.daily_caseload_snapshots, model.daily_waiting_for_booking_snapshots, model.results_daily_arrivals
+
+def run_scenario(seeds, params=None):
+    '''
+    Create a Scenario using the seed vector passed and perform a single
+    run of the model.
+
+    This is a module level function so that it can be sent to worker
+    processes by multiple_replications.
+
+    Params:
+    ------
+    seeds: array-like
+        seed vector for the Scenario
+
+    params: dict, optional (default=None)
+        keyword arguments passed to Scenario (e.g. run_length).
+
+    Returns:
+    -------
+    tuple
+        results of single_run
+    '''
+    if params is None:
+        params = {}
+    scenario = Scenario(seeds=seeds, **params)
+    return single_run(scenario)
+
+#Scenario keyword arguments held by each worker process
+_worker_params = None
+
+def _init_worker(params):
+    '''
+    Store the Scenario keyword arguments in a worker process.  Called
+    once per worker so params is only sent once rather than with
+    every replication.
+    '''
+    global _worker_params
+    _worker_params = params
+
+def _run_worker_scenario(seeds):
+    '''
+    run_scenario using the keyword arguments stored by _init_worker
+    '''
+    return run_scenario(seeds, _worker_params)
+
+def multiple_replications(params, n_reps=10, n_jobs=None, seed=42):
+    '''
+    Perform multiple independent replications of the model.
+    Each replication uses its own seed vector and replications are run
+    in parallel in separate processes.
+
+    Params:
+    ------
+    params: dict
+        keyword arguments passed to Scenario (e.g. run_length).
+        Values must be pickleable (pandas DataFrames are).
+
+    n_reps: int, optional (default=10)
+        Number of independent replications to run.
+
+    n_jobs: int, optional (default=None)
+        Number of worker processes.  None uses all available CPUs.
+        1 runs the replications one after the other in this process.
+
+    seed: int, optional (default=42)
+        seed of the first replication's seed vector.  Replication
+        rep uses seed + rep.
+
+    Returns:
+    -------
+    list
+        results of single_run for each replication
+    '''
+    seed_vectors = [generate_seed_vector(seed + rep) for rep in range(n_reps)]
+
+    if n_jobs == 1:
+        return [run_scenario(seeds, params) for seeds in seed_vectors]
+
+    #params is sent to each worker once when it starts.  Only the seed
+    #vectors (and results) are sent per replication.
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(),
+                             initializer=_init_worker,
+                             initargs=(params,)) as executor:
+        return list(executor.map(_run_worker_scenario, seed_vectors))
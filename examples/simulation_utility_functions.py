@@ -1,21 +1,240 @@
 # Utility functions
+import numpy as np
+import pandas as pd
 import simpy
 
 TRACE = False
 
-def trace(msg, show=TRACE):
+if TRACE:
+    def trace(msg, show=True):
+        '''
+        Utility function for printing a trace as the
+        simulation model executes.
+        Set the TRACE constant to False, to turn tracing off.
+
+        Params:
+        -------
+        msg: str
+            string to print to screen.
+
+        show: bool, optional (default=True)
+            set to False to skip this message.
+        '''
+        if show:
+            print(msg)
+else:
+    def trace(msg, show=False):
+        '''
+        Tracing is turned off (TRACE is False) so trace does nothing.
+        Callers with expensive messages can also check TRACE before
+        formatting them.
+        '''
+        pass
+
+class EventLog():
     '''
-    Utility function for printing a trace as the
-    simulation model executes.
-    Set the TRACE constant to False, to turn tracing off.
+    Column oriented store for a simulation event log.
+
+    Rows are logged as dicts (the same format as the list of dicts
+    used elsewhere) but are held as one list per column rather than
+    as a dict per row.  Columns that are missing from a row are
+    filled with NaN so that to_dataframe() matches the DataFrame
+    built from the equivalent list of dicts.
+
+    Columns with a small set of repeated values (e.g. pathway and
+    event_type) can be dictionary encoded.  These are held as integer
+    codes and only mapped back to their values in to_dataframe()
+
+    Every chunk_size rows the lists are converted to a typed DataFrame
+    chunk.  This caps the number of Python objects held by the log.
+    It also caps the size of the lists, so their growth (reallocation)
+    cost stays small; a deque per column is no quicker to append to and
+    has to be copied to a list before building each chunk.
+    '''
+    def __init__(self, encode=(), chunk_size=65536):
+        '''
+        Params:
+        -------
+        encode: iterable, optional (default=())
+            names of the columns to dictionary encode
+
+        chunk_size: int, optional (default=65536)
+            number of rows held as lists before converting to a chunk
+        '''
+        self.chunk_size = chunk_size
+        self.chunks = []
+
+        #lists for the rows not yet converted to a chunk
+        self.columns = {}
+        self.block_rows = 0
+        self.n_rows = 0
+
+        #value -> code lookup for each encoded column
+        self.codes = {key: {} for key in encode}
+
+    def __len__(self):
+        return self.n_rows
+
+    def _fill_value(self, key):
+        #missing values in encoded columns use the code -1
+        return -1 if key in self.codes else np.nan
+
+    def append(self, row, header=None):
+        '''
+        Log a single event.
+
+        Params:
+        -------
+        row: dict
+            column name: value pairs for the event.
+
+        header: dict, optional (default=None)
+            column name: value pairs shared by several events
+            (e.g. patient and pathway).  Logged alongside row without
+            building a merged dict.
+        '''
+        if header is not None:
+            self._append_fields(header.keys(), header.values())
+        self._append_fields(row.keys(), row.values())
+        self._end_row()
+
+    def append_values(self, keys, values, header=None):
+        '''
+        Log a single event given as a tuple of column names and a
+        tuple of values, rather than as a dict.  Events logged many
+        times with the same columns can share one keys tuple.
+
+        Params:
+        -------
+        keys: tuple
+            column names
+
+        values: tuple
+            values in the same order as keys
+
+        header: dict, optional (default=None)
+            column name: value pairs shared by several events
+        '''
+        if header is not None:
+            self._append_fields(header.keys(), header.values())
+        self._append_fields(keys, values)
+        self._end_row()
+
+    def _end_row(self):
+        self.n_rows += 1
+        self.block_rows += 1
+        if self.block_rows == self.chunk_size:
+            self.flush()
+
+    def _append_fields(self, keys, values):
+        block_rows = self.block_rows
+        columns = self.columns
+        codes = self.codes
+        for key, value in zip(keys, values):
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = []
+            if len(column) < block_rows:
+                column.extend([self._fill_value(key)] * (block_rows - len(column)))
+
+            lookup = codes.get(key)
+            if lookup is not None:
+                value = lookup.setdefault(value, len(lookup))
+
+            column.append(value)
+
+    def extend(self, rows, header=None):
+        '''
+        Log a sequence of events.
+
+        Params:
+        -------
+        rows: iterable
+            iterable of dicts
+
+        header: dict, optional (default=None)
+            column name: value pairs shared by all of the rows.
+        '''
+        for row in rows:
+            self.append(row, header)
+
+    def flush(self):
+        '''
+        Convert the rows held in lists to a DataFrame chunk.
+        '''
+        if self.block_rows == 0:
+            return
+
+        for key, column in self.columns.items():
+            if len(column) < self.block_rows:
+                column.extend([self._fill_value(key)] * (self.block_rows - len(column)))
+
+        self.chunks.append(pd.DataFrame(self.columns))
+        self.columns = {}
+        self.block_rows = 0
+
+    def to_dataframe(self, decode=True):
+        '''
+        Return the event log as a pandas DataFrame
+
+        Params:
+        -------
+        decode: bool, optional (default=True)
+            If True encoded columns are mapped back to their original
+            values.  If False they are returned as pandas Categoricals.
+        '''
+        self.flush()
+
+        if len(self.chunks) == 0:
+            return pd.DataFrame()
+
+        df = pd.concat(self.chunks, ignore_index=True)
+
+        for key, lookup in self.codes.items():
+            if key not in df.columns:
+                continue
+
+            #columns missing from a whole chunk are NaN after concat
+            codes = df[key].fillna(-1).astype(np.int64)
+            values = pd.Categorical.from_codes(codes, categories=list(lookup))
+            df[key] = values.to_numpy() if decode else values
+
+        return df
+
+def summarise_groups(groups, keep_empty=True):
+    '''
+    Describe (count, mean, std, quartiles...) several groups of results
+    in one pandas groupby rather than one describe() per group.
 
     Params:
     -------
-    msg: str
-        string to print to screen.
+    groups: dict
+        column label: list of results.  Columns are returned in the
+        same order.
+
+    keep_empty: bool, optional (default=True)
+        If True a group with no results is returned as a column with a
+        count of 0.  If False it is dropped.
+
+    Returns:
+    -------
+    pd.DataFrame
+        row per statistic and column per group
     '''
-    if show:
-        print(msg)
+    labels = [label for label, results in groups.items()
+              if keep_empty or len(results) > 0]
+
+    df = pd.DataFrame({
+        'group': np.repeat(list(groups), [len(results) for results in groups.values()]),
+        'result': np.concatenate([np.asarray(results, dtype=np.float64)
+                                  for results in groups.values()])
+        })
+
+    summary_frame = df.groupby('group', sort=False)['result'].describe().T
+    summary_frame = summary_frame.reindex(columns=labels)
+    summary_frame.loc['count'] = summary_frame.loc['count'].fillna(0)
+    summary_frame.columns.name = None
+    return summary_frame
 
 class CustomResource(simpy.Resource):
     def __init__(self, env, capacity, id_attribute=None):
@@ -5,7 +5,6 @@ from examples.ex_1_simplest_case.simulation_execution_functions import single_ru
 from examples.ex_1_simplest_case.model_classes import Scenario, TreatmentCentreModelSimpleNurseStepOnly
 from examples.distribution_classes import Normal
 from vidigi.animation import animate_activity_log
-import gc
 
 st.set_page_config(layout="wide",
                    initial_sidebar_state="expanded",
@@ -21,8 +20,6 @@ On changing the values of the sliders, you can click 'run simulation' again to g
     """
 )
 
-gc.collect()
-
 col1, col2 = st.columns(2)
 
 with col1:
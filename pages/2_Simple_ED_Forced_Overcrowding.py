@@ -3,14 +3,11 @@ import pandas as pd
 from examples.ex_1_simplest_case.simulation_execution_functions import single_run, multiple_replications
 from examples.ex_1_simplest_case.model_classes import Scenario, TreatmentCentreModelSimpleNurseStepOnly
 from vidigi.animation import animate_activity_log
-import gc
 
 st.set_page_config(layout="wide",
                    initial_sidebar_state="expanded",
                    page_title="Forced Overcrowding - Simple ED")
 
-gc.collect()
-
 st.title("Forced Overcrowding Scenario")
 
 st.markdown(
@@ -1,121 +1,268 @@
+import base64
+import os
+import urllib.request
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from examples.ex_2_branching_and_optional_paths.simulation_execution_functions import (
-    single_run,
     multiple_replications,
 )
-from examples.ex_2_branching_and_optional_paths.model_classes import (
-    Scenario,
-    TreatmentCentreModel,
-)
+from examples.ex_2_branching_and_optional_paths.model_classes import Scenario
 from vidigi.animation import animate_activity_log
-import gc
 
 st.set_page_config(
     layout="wide", initial_sidebar_state="expanded", page_title="Complex ED"
 )
 
-st.title("Simple Interactive Treatment Step")
+# The results only depend on the slider values, so cache them on those values.
+# Pressing the button again without changing the sliders reuses the last results.
+# The scenario is passed as a dict of plain values as these are quick to hash.
+# Each entry holds the event log of every replication, so only the most recent
+# few are kept.
+# n_jobs doesn't change the results, so it is left out of the cache key (_ prefix)
+# The progress bar is created in here, not passed in, as Streamlit can only replay
+# elements made inside a cached function. A cache hit shows it as finished.
+@st.cache_data(show_spinner=False, max_entries=5)
+def run_replications(scenario_params, n_reps, rc_period, _n_jobs=None):
+    # Show how many replications have finished, as long runs can take a while
+    progress_bar = st.progress(0.0, text="Running the replications...")
 
-st.markdown(
-    """
-This interactive simulation builds on the previous examples to demonstrate a multi-step, branching pathway with some optional steps.
-    """
-)
+    def show_progress(n_complete, n_reps):
+        progress_bar.progress(
+            n_complete / n_reps,
+            text=f"Completed {n_complete} of {n_reps} replications",
+        )
 
-gc.collect()
+    df_results_summary, detailed_results = multiple_replications(
+        Scenario(**scenario_params),
+        n_reps=n_reps,
+        rc_period=rc_period,
+        return_detailed_logs=True,
+        n_jobs=_n_jobs,
+        callback=show_progress,
+    )
+    # Patient ids and rep numbers are small, so hold them as narrower ints
+    detailed_results = detailed_results.astype({"patient": "int32", "rep": "int16"})
+    return df_results_summary, detailed_results
 
-col1, col2, col3, col4 = st.columns(4)
+BACKGROUND_IMAGE_URL = "https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Full%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png"
 
-with col1:
-    st.subheader("Triage")
-    n_triage = st.slider("👨‍⚕️👩‍⚕️ Number of Triage Cubicles", 1, 10, step=1, value=4)
-    prob_trauma = st.slider(
-        "🚑 Probability that a new arrival is a trauma patient",
-        0.0,
-        1.0,
-        step=0.01,
-        value=0.3,
-        help="0 = No arrivals are trauma patients, 1 = All arrivals are trauma patients",
-    )
+# Download the background image and embed it in the figure, so the browser
+# doesn't have to fetch it from GitHub every time the animation is drawn.
+# If the download fails the URL is returned so the browser can try to fetch it.
+# The result is kept for an hour, so a failed download holds up at most one run
+# an hour and is then tried again rather than being kept until a restart.
+@st.cache_resource(show_spinner=False, ttl="1h")
+def read_background_image(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            image = response.read()
+    except OSError:
+        return url
+    return "data:image/png;base64," + base64.b64encode(image).decode()
 
-with col2:
-    st.subheader("Trauma Pathway")
-    n_trauma = st.slider(
-        "👨‍⚕️👩‍⚕️ Number of Trauma Bays for Stabilisation", 1, 10, step=1, value=6
-    )
-    n_cubicles_2 = st.slider(
-        "👨‍⚕️👩‍⚕️ Number of Treatment Cubicles for Trauma", 1, 10, step=1, value=6
+# The positions of each step in the animation don't depend on the sliders,
+# so build them once and reuse them
+@st.cache_data(show_spinner=False)
+def event_positions():
+    # One list per column, with a row per step.
+    # Arrival isn't shown ('arrival', x=10, y=250, label "Arrival").
+    # Rows are triage (minor and trauma), then the minors (non-trauma) pathway,
+    # then the trauma pathway, then exit. Only the steps where a patient is using
+    # a resource have one.
+    return pd.DataFrame(
+        {
+            "event": [
+                "triage_wait_begins",
+                "triage_begins",
+                "MINORS_registration_wait_begins",
+                "MINORS_registration_begins",
+                "MINORS_examination_wait_begins",
+                "MINORS_examination_begins",
+                "MINORS_treatment_wait_begins",
+                "MINORS_treatment_begins",
+                "TRAUMA_stabilisation_wait_begins",
+                "TRAUMA_stabilisation_begins",
+                "TRAUMA_treatment_wait_begins",
+                "TRAUMA_treatment_begins",
+                "exit",
+            ],
+            "x": [155, 155, 295, 295, 460, 460, 625, 625, 295, 295, 625, 625, 670],
+            "y": [400, 315, 145, 85, 145, 85, 145, 85, 540, 480, 540, 480, 330],
+            "label": [
+                "Waiting for<br>Triage",
+                "Being Triaged",
+                "Waiting for<br>Registration",
+                "Being<br>Registered",
+                "Waiting for<br>Examination",
+                "Being<br>Examined",
+                "Waiting for<br>Treatment",
+                "Being<br>Treated",
+                "Waiting for<br>Stabilisation",
+                "Being<br>Stabilised",
+                "Waiting for<br>Treatment",
+                "Being<br>Treated",
+                "Exit",
+            ],
+            "resource": [
+                np.nan,
+                "n_triage",
+                np.nan,
+                "n_reg",
+                np.nan,
+                "n_exam",
+                np.nan,
+                "n_cubicles_1",
+                np.nan,
+                "n_trauma",
+                np.nan,
+                "n_cubicles_2",
+                np.nan,
+            ],
+        }
     )
 
-with col3:
-    st.subheader("Non-Trauma Pathway")
-    n_reg = st.slider("👨‍⚕️👩‍⚕️ Number of Registration Cubicles", 1, 10, step=1, value=3)
-    n_exam = st.slider(
-        "👨‍⚕️👩‍⚕️ Number of Examination Rooms for non-trauma patients",
-        1,
-        10,
-        step=1,
-        value=3,
+# The animation is built from rep 1, which only depends on the scenario and the
+# run length, so the figure can be cached on those rather than on the event log.
+# The background image is passed by its URL and read inside, so the key stays small.
+# Figures are large, so only the most recent few are kept.
+@st.cache_resource(show_spinner=False, max_entries=5)
+def build_animation(scenario_params, limit_duration, every_x_time_units,
+                    background_image_url, _event_log):
+    return animate_activity_log(
+        event_log=_event_log,
+        event_position_df=event_positions(),
+        scenario=Scenario(**scenario_params),
+        entity_col_name="patient",
+        debug_mode=True,
+        limit_duration=limit_duration,
+        every_x_time_units=every_x_time_units,
+        include_play_button=True,
+        gap_between_entities=10,
+        gap_between_queue_rows=25,
+        plotly_height=700,
+        plotly_width=1200,
+        override_x_max=700,
+        override_y_max=675,
+        text_size=22,
+        entity_icon_size=18,
+        wrap_queues_at=10,
+        step_snapshot_max=30,
+        time_display_units="dhm_ampm",
+        display_stage_labels=False,
+        add_background_image=read_background_image(background_image_url),
     )
 
-with col4:
-    st.subheader("Non-Trauma Treatment")
-    n_cubicles_1 = st.slider(
-        "👨‍⚕️👩‍⚕️ Number of Treatment Cubicles for Non-Trauma", 1, 10, step=1, value=2
-    )
-    non_trauma_treat_p = st.slider(
-        "🤕 Probability that a non-trauma patient will need treatment",
-        0.0,
-        1.0,
-        step=0.01,
-        value=0.7,
-        help="0 = No non-trauma patients need treatment, 1 = All non-trauma patients need treatment",
-    )
+st.title("Simple Interactive Treatment Step")
 
+st.markdown(
+    """
+This interactive simulation builds on the previous examples to demonstrate a multi-step, branching pathway with some optional steps.
+    """
+)
+
+# The inputs are in a form so that moving a slider doesn't rerun the page.
+# The values are only sent when the simulation is run.
+with st.form("sim_form"):
+    col1, col2, col3, col4 = st.columns(4)
 
-col5, col6 = st.columns(2)
-with col5:
-    st.write(
-        "Total rooms in use is {}".format(
-            n_cubicles_1 + n_cubicles_2 + n_exam + n_trauma + n_triage + n_reg
+    with col1:
+        st.subheader("Triage")
+        n_triage = st.slider("👨‍⚕️👩‍⚕️ Number of Triage Cubicles", 1, 10, step=1, value=4)
+        prob_trauma = st.slider(
+            "🚑 Probability that a new arrival is a trauma patient",
+            0.0,
+            1.0,
+            step=0.01,
+            value=0.3,
+            help="0 = No arrivals are trauma patients, 1 = All arrivals are trauma patients",
         )
-    )
-with col6:
-    with st.expander("Advanced Parameters"):
-        seed = st.slider(
-            "🎲 Set a random number for the computer to start from",
-            1,
-            1000,
-            step=1,
-            value=42,
+
+    with col2:
+        st.subheader("Trauma Pathway")
+        n_trauma = st.slider(
+            "👨‍⚕️👩‍⚕️ Number of Trauma Bays for Stabilisation", 1, 10, step=1, value=6
+        )
+        n_cubicles_2 = st.slider(
+            "👨‍⚕️👩‍⚕️ Number of Treatment Cubicles for Trauma", 1, 10, step=1, value=6
         )
 
-        n_reps = st.slider(
-            "🔁 How many times should the simulation run? WARNING: Fast/modern computer required to take this above 5 replications.",
+    with col3:
+        st.subheader("Non-Trauma Pathway")
+        n_reg = st.slider("👨‍⚕️👩‍⚕️ Number of Registration Cubicles", 1, 10, step=1, value=3)
+        n_exam = st.slider(
+            "👨‍⚕️👩‍⚕️ Number of Examination Rooms for non-trauma patients",
             1,
             10,
             step=1,
             value=3,
         )
 
-        run_time_days = st.slider(
-            "🗓️ How many days should we run the simulation for each time?",
-            1,
-            60,
-            step=1,
-            value=5,
+    with col4:
+        st.subheader("Non-Trauma Treatment")
+        n_cubicles_1 = st.slider(
+            "👨‍⚕️👩‍⚕️ Number of Treatment Cubicles for Non-Trauma", 1, 10, step=1, value=2
+        )
+        non_trauma_treat_p = st.slider(
+            "🤕 Probability that a non-trauma patient will need treatment",
+            0.0,
+            1.0,
+            step=0.01,
+            value=0.7,
+            help="0 = No non-trauma patients need treatment, 1 = All non-trauma patients need treatment",
         )
 
 
-# A user must press a streamlit button to run the model
-button_run_pressed = st.button("Run simulation")
+    col5, col6 = st.columns(2)
+    with col5:
+        st.write(
+            "Total rooms in use is {}".format(
+                n_cubicles_1 + n_cubicles_2 + n_exam + n_trauma + n_triage + n_reg
+            )
+        )
+    with col6:
+        with st.expander("Advanced Parameters"):
+            seed = st.slider(
+                "🎲 Set a random number for the computer to start from",
+                1,
+                1000,
+                step=1,
+                value=42,
+            )
+
+            n_reps = st.slider(
+                "🔁 How many times should the simulation run? WARNING: Fast/modern computer required to take this above 5 replications.",
+                1,
+                10,
+                step=1,
+                value=3,
+            )
+
+            n_jobs = st.slider(
+                "🖥️ How many processors should be used to run the simulations?",
+                1,
+                # the slider needs a max above its min
+                max(os.cpu_count() or 1, 2),
+                step=1,
+                value=os.cpu_count() or 1,
+            )
+
+            run_time_days = st.slider(
+                "🗓️ How many days should we run the simulation for each time?",
+                1,
+                60,
+                step=1,
+                value=5,
+            )
+
+    # A user must press a streamlit button to run the model
+    button_run_pressed = st.form_submit_button("Run simulation")
 
 if button_run_pressed:
     # add a spinner and then display success box
     with st.spinner("Simulating the department..."):
-        args = Scenario(
+        scenario_params = dict(
             random_number_set=seed,
             n_triage=n_triage,
             n_reg=n_reg,
@@ -127,136 +274,44 @@ if button_run_pressed:
             prob_trauma=prob_trauma,
         )
 
-        model = TreatmentCentreModel(args)
+        df_results_summary, detailed_results = run_replications(
+            scenario_params,
+            n_reps=n_reps,
+            rc_period=run_time_days * 24 * 60,
+            _n_jobs=n_jobs,
+        )
 
+        # The single run is the first replication (the one that is animated),
+        # so it is taken from the replications rather than simulated again
         st.subheader("Single Run")
 
-        results_df = single_run(args)
-
-        st.dataframe(results_df)
+        st.dataframe(df_results_summary.iloc[[0]])
 
         st.subheader("Multiple Runs")
 
-        df_results_summary, detailed_results = multiple_replications(
-            args,
-            n_reps=n_reps,
-            rc_period=run_time_days * 24 * 60,
-            return_detailed_logs=True,
-        )
-
         st.dataframe(df_results_summary)
 
-        event_position_df = pd.DataFrame(
-            [
-                # {'event': 'arrival', 'x':  10, 'y': 250, 'label': "Arrival" },
-                # Triage - minor and trauma
-                {
-                    "event": "triage_wait_begins",
-                    "x": 155,
-                    "y": 400,
-                    "label": "Waiting for<br>Triage",
-                },
-                {
-                    "event": "triage_begins",
-                    "x": 155,
-                    "y": 315,
-                    "resource": "n_triage",
-                    "label": "Being Triaged",
-                },
-                # Minors (non-trauma) pathway
-                {
-                    "event": "MINORS_registration_wait_begins",
-                    "x": 295,
-                    "y": 145,
-                    "label": "Waiting for<br>Registration",
-                },
-                {
-                    "event": "MINORS_registration_begins",
-                    "x": 295,
-                    "y": 85,
-                    "resource": "n_reg",
-                    "label": "Being<br>Registered",
-                },
-                {
-                    "event": "MINORS_examination_wait_begins",
-                    "x": 460,
-                    "y": 145,
-                    "label": "Waiting for<br>Examination",
-                },
-                {
-                    "event": "MINORS_examination_begins",
-                    "x": 460,
-                    "y": 85,
-                    "resource": "n_exam",
-                    "label": "Being<br>Examined",
-                },
-                {
-                    "event": "MINORS_treatment_wait_begins",
-                    "x": 625,
-                    "y": 145,
-                    "label": "Waiting for<br>Treatment",
-                },
-                {
-                    "event": "MINORS_treatment_begins",
-                    "x": 625,
-                    "y": 85,
-                    "resource": "n_cubicles_1",
-                    "label": "Being<br>Treated",
-                },
-                # Trauma pathway
-                {
-                    "event": "TRAUMA_stabilisation_wait_begins",
-                    "x": 295,
-                    "y": 540,
-                    "label": "Waiting for<br>Stabilisation",
-                },
-                {
-                    "event": "TRAUMA_stabilisation_begins",
-                    "x": 295,
-                    "y": 480,
-                    "resource": "n_trauma",
-                    "label": "Being<br>Stabilised",
-                },
-                {
-                    "event": "TRAUMA_treatment_wait_begins",
-                    "x": 625,
-                    "y": 540,
-                    "label": "Waiting for<br>Treatment",
-                },
-                {
-                    "event": "TRAUMA_treatment_begins",
-                    "x": 625,
-                    "y": 480,
-                    "resource": "n_cubicles_2",
-                    "label": "Being<br>Treated",
-                },
-                {"event": "exit", "x": 670, "y": 330, "label": "Exit"},
-            ]
-        )
+        # The replications' logs are joined in rep order, so rep 1 is the first
+        # block of rows and can be sliced off without checking every row
+        rep_1_rows = detailed_results["rep"].searchsorted(1, side="right")
+
+        # A snapshot every 5 minutes gives tens of thousands of frames for the longer
+        # runs, which makes the figure too big for the browser to play smoothly.
+        # Widen the gap between snapshots so there are at most 2000 frames.
+        limit_duration = run_time_days * 24 * 60
+        every_x_time_units = max(5, -(-limit_duration // 2000))
+        if every_x_time_units > 5:
+            st.caption(
+                f"The animation shows a snapshot every {every_x_time_units} minutes to keep it a manageable size."
+            )
 
         st.plotly_chart(
-            animate_activity_log(
-                event_log=detailed_results[detailed_results["rep"] == 1],
-                event_position_df=event_position_df,
-                scenario=args,
-                entity_col_name="patient",
-                debug_mode=True,
-                limit_duration=run_time_days * 24 * 60,
-                every_x_time_units=5,
-                include_play_button=True,
-                gap_between_entities=10,
-                gap_between_queue_rows=25,
-                plotly_height=700,
-                plotly_width=1200,
-                override_x_max=700,
-                override_y_max=675,
-                text_size=22,
-                entity_icon_size=18,
-                wrap_queues_at=10,
-                step_snapshot_max=30,
-                time_display_units="dhm_ampm",
-                display_stage_labels=False,
-                add_background_image="https://raw.githubusercontent.com/hsma-programme/Teaching_DES_Concepts_Streamlit/main/resources/Full%20Model%20Background%20Image%20-%20Horizontal%20Layout.drawio.png",
+            build_animation(
+                scenario_params,
+                limit_duration,
+                every_x_time_units,
+                BACKGROUND_IMAGE_URL,
+                _event_log=detailed_results.iloc[:rep_1_rows],
             ),
             use_container_width=False,
             config={"displayModeBar": False},
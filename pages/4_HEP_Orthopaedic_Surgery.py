@@ -1,4 +1,3 @@
-import gc
 import time
 import datetime as dt
 import streamlit as st
@@ -17,8 +16,6 @@ st.set_page_config(
     layout="wide", initial_sidebar_state="expanded", page_title="Orthopaedic Ward - HEP"
 )
 
-gc.collect()
-
 st.title("Orthopaedic Ward - Hospital Efficiency Project")
 
 st.markdown(
@@ -443,66 +440,43 @@ if button_run_pressed:
             gap_between_resource_rows=200,
         )
 
+        # Every snapshot time in the animation. Counting against these ensures we have a value for
+        # every snapshot time - this avoids the risk of the number of frames represented in the
+        # dataframes below not matching the total number of animation frames in the actual output figure
+        snapshot_times = full_patient_df_plus_pos["snapshot_time"].drop_duplicates().sort_values()
+
         # Create an additional dataframe calculating the number of times cancellations occur due
-        # to no bed being available
+        # to no bed being available (0 for days with no cancellations)
         counts_not_avail = (
-            full_patient_df_plus_pos[
-                full_patient_df_plus_pos["event"] == "no_bed_available"
+            full_patient_df_plus_pos.loc[
+                full_patient_df_plus_pos["event"] == "no_bed_available", "snapshot_time"
             ]
-            .sort_values("snapshot_time")[["snapshot_time", "patient"]]
-            .groupby("snapshot_time")
-            .agg("count")
+            .value_counts()
+            .reindex(snapshot_times, fill_value=0)
+            .rename("patient")
+            .reset_index()
         )
 
-        # Ensure we have a value for every snapshot time in the animation by using this as the
-        # index - this avoids the risk of the number of frames represented in this dataframe not
-        # matching the total number of animation frames in the actual output figure
-        counts_not_avail = (
-            counts_not_avail.reset_index()
-            .merge(
-                full_patient_df_plus_pos[["snapshot_time"]].drop_duplicates(),
-                how="right",
-            )
-            .sort_values("snapshot_time")
-        ).reset_index(drop=True)
-
-        counts_not_avail["patient"] = counts_not_avail["patient"].fillna(0)
-
         # Calculate a running total of this value, which will be used to add the correct value
         # to each individual frame
-        counts_not_avail["running_total"] = counts_not_avail.sort_values(
-            "snapshot_time"
-        )["patient"].cumsum()
+        counts_not_avail["running_total"] = counts_not_avail["patient"].cumsum()
 
         # Create an additional dataframe calculating the number of operations completed per day
+        # (0 for days with no operations completed)
         counts_ops_completed = (
             full_patient_df_plus_pos[
                 full_patient_df_plus_pos["event"] == "post_surgery_stay_begins"
             ][["snapshot_time", "patient"]]
-            .drop_duplicates("patient")
-            .groupby("snapshot_time")
-            .agg("count")
+            .drop_duplicates("patient")["snapshot_time"]
+            .value_counts()
+            .reindex(snapshot_times, fill_value=0)
+            .rename("patient")
+            .reset_index()
         )
-        # Ensure we have a value for every snapshot time in the animation by using this as the
-        # index - this avoids the risk of the number of frames represented in this dataframe not
-        # matching the total number of animation frames in the actual output figure
-        counts_ops_completed = (
-            counts_ops_completed.reset_index()
-            .merge(
-                full_patient_df_plus_pos[["snapshot_time"]].drop_duplicates(),
-                how="right",
-            )
-            .sort_values("snapshot_time")
-        ).reset_index(drop=True)
-
-        # For any days with no value, ensure this is changed to a 0
-        counts_ops_completed["patient"] = counts_ops_completed["patient"].fillna(0)
 
         # Calculate a running total of this value, which will be used to add the correct value
         # to each individual frame
-        counts_ops_completed["running_total"] = counts_ops_completed.sort_values(
-            "snapshot_time"
-        )["patient"].cumsum()
+        counts_ops_completed["running_total"] = counts_ops_completed["patient"].cumsum()
         counts_not_avail = counts_not_avail.merge(
             counts_ops_completed.rename(columns={"running_total": "completed"}),
             how="left",
@@ -619,6 +593,17 @@ if button_run_pressed:
         # Now we need to add our traces to each individual frame
         ##########################################################
         # To work correctly, these need to be provided in the same order as the traces above
+        # Pull out the values used in each frame once, so that each frame only needs to
+        # index into these arrays by its position
+        ops_completed_running_total = counts_ops_completed["running_total"].to_numpy()
+        slots_lost_running_total = counts_not_avail["running_total"].to_numpy()
+        perc_slots_lost = counts_not_avail["perc_slots_lost"].to_numpy()
+        lost_slots_x = counts_not_avail["snapshot_time"].to_numpy()
+        lost_slots_y = counts_not_avail["patient_x"].to_numpy()
+        position_label_x = [pos + 10 for pos in event_position_df["x"].to_list()]
+        position_label_y = event_position_df["y"].to_list()
+        position_label_text = event_position_df["label"].to_list()
+
         for i, frame in enumerate(fig.frames):
             frame.data = (
                 frame.data
@@ -631,7 +616,7 @@ if button_run_pressed:
                     go.Scatter(
                         x=[100],
                         y=[30],
-                        text=f"Total Operations Completed: {int(counts_ops_completed.sort_values('snapshot_time')['running_total'][i])}",
+                        text=f"Total Operations Completed: {int(ops_completed_running_total[i])}",
                         mode="text",
                         textfont=dict(size=20),
                         showlegend=False,
@@ -643,7 +628,7 @@ if button_run_pressed:
                     go.Scatter(
                         x=[600],
                         y=[800],
-                        text=f"Total slots lost: {int(counts_not_avail['running_total'][i])}<br>({counts_not_avail['perc_slots_lost'][i]:.1%})",
+                        text=f"Total slots lost: {int(slots_lost_running_total[i])}<br>({perc_slots_lost[i]:.1%})",
                         mode="text",
                         textfont=dict(size=20),
                         showlegend=False,
@@ -653,11 +638,11 @@ if button_run_pressed:
                 # Position labels
                 (
                     go.Scatter(
-                        x=[pos + 10 for pos in event_position_df["x"].to_list()],
-                        y=event_position_df["y"].to_list(),
+                        x=position_label_x,
+                        y=position_label_y,
                         mode="text",
                         name="",
-                        text=event_position_df["label"].to_list(),
+                        text=position_label_text,
                         textposition="middle right",
                         hoverinfo="none",
                     ),
@@ -666,8 +651,8 @@ if button_run_pressed:
                 # Line subplot
                 (
                     go.Scatter(
-                        x=counts_not_avail["snapshot_time"][0 : i + 1].values,
-                        y=counts_not_avail["patient_x"][0 : i + 1].values,
+                        x=lost_slots_x[0 : i + 1],
+                        y=lost_slots_y[0 : i + 1],
                         mode="lines",
                         # name="line",
                         # hoverinfo='none',
@@ -1,8 +1,7 @@
-import gc
 import time
-import math
 import datetime as dt
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -17,7 +16,20 @@ st.set_page_config(layout="wide",
                    initial_sidebar_state="expanded",
                    page_title="Mental Health - Booking Model")
 
-gc.collect()
+# The input files don't change while the app is running, so only read them once
+@st.cache_data(show_spinner=False)
+def read_input_file(path):
+    return pd.read_csv(path)
+
+# Reshaping the event log is the slowest step of building the animation, so cache it.
+# It is only rerun when the event log or the reshape settings change
+@st.cache_data(show_spinner=False)
+def reshape_event_log(event_log_df, limit_duration, step_snapshot_max):
+    return reshape_for_animations(event_log_df,
+                                  entity_col_name="patient",
+                                  limit_duration=limit_duration,
+                                  every_x_time_units=1,
+                                  step_snapshot_max=step_snapshot_max)
 
 st.title("Mental Health - Appointment Booking Model")
 
@@ -42,7 +54,7 @@ However, it is possible to switch to other scenarios
 
 st.subheader("Weekly Slots")
 st.markdown("Edit the number of daily slots available per clinic by clicking in the boxes below, or leave as the default schedule")
-shifts = pd.read_csv("examples/ex_4_community/data/shifts.csv")
+shifts = read_input_file("examples/ex_4_community/data/shifts.csv")
 shifts_edited = st.data_editor(shifts)
 
 scenario_choice = st.selectbox(
@@ -71,62 +83,62 @@ if button_run_pressed:
         RUN_LENGTH = RESULTS_COLLECTION + WARM_UP
 
         #set up the scenario for the model to run.
-        scenarios = {}
-
-        scenarios['as-is'] = Scenario(RUN_LENGTH,
-                                      WARM_UP,
-                                      prop_carve_out=prop_carve_out,
-                                      seeds=generate_seed_vector(),
-                                      slots_file=shifts_edited)
-
-        scenarios['pooled'] = Scenario(RUN_LENGTH,
-                                       WARM_UP,
-                                       prop_carve_out=prop_carve_out,
-                                       pooling=True,
-                                       seeds=generate_seed_vector(),
-                                       slots_file=shifts_edited)
-
-        scenarios['no_carve_out'] = Scenario(RUN_LENGTH,
-                                             WARM_UP,
-                                             pooling=True,
-                                             prop_carve_out=0.0,
-                                             seeds=generate_seed_vector(),
-                                             slots_file=shifts_edited)
-
-        col1, col2, col3 = st.columns(3)
-
+        #Only the chosen scenario is set up, as setting up each scenario
+        #builds its own appointment books
         if scenario_choice == "As-is":
-            st.subheader("As-is")
-            results_all, results_low, results_high, event_log = single_run(scenarios['as-is'])
-            st.dataframe(results_summary(results_all, results_low, results_high))
+            scenario_title = "As-is"
+            scenario = Scenario(RUN_LENGTH,
+                                WARM_UP,
+                                prop_carve_out=prop_carve_out,
+                                seeds=generate_seed_vector(),
+                                slots_file=shifts_edited)
+
         elif scenario_choice == "With Pooling":
-            st.subheader("With Pooling")
-            results_all, results_low, results_high, event_log = single_run(scenarios['pooled'])
-            st.dataframe(results_summary(results_all, results_low, results_high))
+            scenario_title = "With Pooling"
+            scenario = Scenario(RUN_LENGTH,
+                                WARM_UP,
+                                prop_carve_out=prop_carve_out,
+                                pooling=True,
+                                seeds=generate_seed_vector(),
+                                slots_file=shifts_edited)
 
         elif scenario_choice == "With Pooling - No Carve-out":
-            st.subheader("Pooled with no carve out")
-            results_all, results_low, results_high, event_log = single_run(scenarios['no_carve_out'])
-            st.dataframe(results_summary(results_all, results_low, results_high))
+            scenario_title = "Pooled with no carve out"
+            scenario = Scenario(RUN_LENGTH,
+                                WARM_UP,
+                                pooling=True,
+                                prop_carve_out=0.0,
+                                seeds=generate_seed_vector(),
+                                slots_file=shifts_edited)
+
+        col1, col2, col3 = st.columns(3)
+
+        st.subheader(scenario_title)
+        results_all, results_low, results_high, event_log = single_run(scenario)
+        st.dataframe(results_summary(results_all, results_low, results_high))
 
 
         event_log_df = pd.DataFrame(event_log)
 
 
         event_log_df['event_original'] = event_log_df['event']
-        event_log_df['event'] = event_log_df.apply(lambda x: f"{x['event']}{f'_{int(x.booked_clinic)}' if pd.notna(x['booked_clinic']) else ''}", axis=1)
+        # Add the booked clinic to the event name (e.g. have_appointment_3) so each clinic
+        # gets its own position in the animation
+        booked_clinic = event_log_df['booked_clinic']
+        event_log_df['event'] = event_log_df['event'] + (
+            '_' + booked_clinic.astype('Int64').astype(str)
+            ).where(booked_clinic.notna(), '')
 
-        full_patient_df = reshape_for_animations(event_log_df,
-                                                 entity_col_name="patient",
-                                                 limit_duration=WARM_UP+180,
-                                                 every_x_time_units=1,
-                                                 step_snapshot_max=50)
+        full_patient_df = reshape_event_log(event_log_df,
+                                            limit_duration=WARM_UP+180,
+                                            step_snapshot_max=50)
 
         # Remove the warm-up period from the event log
         full_patient_df = full_patient_df[full_patient_df["snapshot_time"] >= WARM_UP]
 
 
-        clinics =  [x for x in event_log_df['booked_clinic'].sort_values().unique().tolist() if not math.isnan(x)]
+        # Sort the distinct clinics rather than the whole event log
+        clinics = sorted(event_log_df['booked_clinic'].dropna().unique().tolist())
 
         clinic_waits = [{'event': f'appointment_booked_waiting_{int(clinic)}',
           'y':  950-(clinic+1)*80,
@@ -141,39 +153,31 @@ if button_run_pressed:
           'label': f"Attending appointment<br>at clinic {int(clinic)}"}
           for clinic in clinics]
 
-        event_position_df = pd.concat([pd.DataFrame(clinic_waits),(pd.DataFrame(clinic_attends))])
-
         referred_out = [{'event': f'referred_out_{int(clinic)}',
           'y':  950-(clinic+1)*80,
           'x': 125,
           'label': f"Referred Out From <br>clinic {int(clinic)}"}
           for clinic in clinics]
 
-        event_position_df = pd.concat([event_position_df,(pd.DataFrame(referred_out))])
+        # Build the positioning dataframe in one step from all of the position lists
+        event_position_df = pd.DataFrame(clinic_waits + clinic_attends + referred_out)
 
         # event_position_df = pd.concat([
         #     event_position_df,
         #     pd.DataFrame([{'event': 'exit', 'x':  270, 'y': 70, 'label': "Exit"}])]) .reset_index(drop=True)
 
-        clinic_lkup_df = pd.DataFrame([
-            {'clinic': 0, 'icon': "🟠"},
-            {'clinic': 1, 'icon': "🟡"},
-            {'clinic': 2, 'icon': "🟢"},
-            {'clinic': 3, 'icon': "🔵"},
-            {'clinic': 4, 'icon': "🟣"},
-            {'clinic': 5, 'icon': "🟤"},
-            {'clinic': 6, 'icon': "⚫"},
-            {'clinic': 7, 'icon': "⚪"},
-            {'clinic': 8, 'icon': "🔶"},
-            {'clinic': 9, 'icon': "🔷"},
-            {'clinic': 10, 'icon': "🟩"}
-        ])
-
+        # Icon for each clinic, indexed by clinic id
+        clinic_icons = np.array(["🟠", "🟡", "🟢", "🔵", "🟣", "🟤", "⚫", "⚪", "🔶", "🔷", "🟩"],
+                                dtype=object)
 
         if scenario_choice == "With Pooling" or scenario_choice == "With Pooling - No Carve-out":
-            event_position_df = event_position_df.merge(clinic_lkup_df, how="left")
-            event_position_df["label"] = event_position_df.apply(lambda x: f"{x['label']} {x['icon']}" if pd.notna(x['icon']) else x['label'], axis=1)
-            event_position_df = event_position_df.drop(columns="icon")
+            # Add the clinic's icon to the labels of the booked positions
+            clinic = event_position_df["clinic"]
+            has_icon = clinic.isin(range(len(clinic_icons)))
+            event_position_df.loc[has_icon, "label"] = (
+                event_position_df.loc[has_icon, "label"] + " " +
+                clinic_icons[clinic[has_icon].astype(int)]
+                )
 
         event_position_df = event_position_df.drop(columns="clinic")
 
@@ -192,64 +196,36 @@ if button_run_pressed:
 
 
         if scenario_choice == "With Pooling" or scenario_choice == "With Pooling - No Carve-out":
-            def show_home_clinic(row):
-                if "more" not in row["icon"]:
-                    if row["home_clinic"] == 0:
-                        return "🟠"
-                    if row["home_clinic"] == 1:
-                        return "🟡"
-                    if row["home_clinic"] == 2:
-                        return "🟢"
-                    if row["home_clinic"] == 3:
-                        return "🔵"
-                    if row["home_clinic"] == 4:
-                        return "🟣"
-                    if row["home_clinic"] == 5:
-                        return "🟤"
-                    if row["home_clinic"] == 6:
-                        return "⚫"
-                    if row["home_clinic"] == 7:
-                        return "⚪"
-                    if row["home_clinic"] == 8:
-                        return "🔶"
-                    if row["home_clinic"] == 9:
-                        return "🔷"
-                    if row["home_clinic"] == 10:
-                        return "🟩"
-                    else:
-                        return row["icon"]
-                else:
-                    return row["icon"]
-
-            full_patient_df_plus_pos = full_patient_df_plus_pos.assign(icon=full_patient_df_plus_pos.apply(show_home_clinic, axis=1))
-
-
-        def show_priority_icon(row):
-            if "more" not in row["icon"]:
-                if row["pathway"] == 2:
-                    if scenario_choice == "As-is":
-                        return "🚨"
-                    else:
-                        return f"{row['icon']}*"
-                else:
-                    return row["icon"]
-            else:
-                return row["icon"]
-
-        def add_los_to_icon(row):
-            if row["event_original"] == "have_appointment":
-                return f'{row["icon"]}<br>{int(row["wait"])}'
-            else:
-                return row["icon"]
-
-        full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
-            icon=full_patient_df_plus_pos.apply(show_priority_icon, axis=1)
-            )
+            # Show each patient with the icon of their home clinic
+            icon = full_patient_df_plus_pos["icon"]
+            home_clinic = full_patient_df_plus_pos["home_clinic"]
+            has_clinic_icon = (~icon.str.contains("more", regex=False)) & \
+                home_clinic.isin(range(len(clinic_icons)))
+
+            full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
+                icon=icon.mask(has_clinic_icon,
+                               clinic_icons[home_clinic.where(has_clinic_icon, 0).astype(int)])
+                )
+
 
-        full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
-            icon=full_patient_df_plus_pos.apply(add_los_to_icon, axis=1)
+        # Icons for queues that are too long to show in full ("+ n more") are left as they are
+        icon = full_patient_df_plus_pos["icon"]
+        high_priority = (~icon.str.contains("more", regex=False)) & \
+            (full_patient_df_plus_pos["pathway"] == 2)
+
+        if scenario_choice == "As-is":
+            icon = icon.mask(high_priority, "🚨")
+        else:
+            icon = icon.mask(high_priority, icon + "*")
+
+        # Show the wait alongside the icon of anyone attending their appointment
+        icon = icon.mask(
+            full_patient_df_plus_pos["event_original"] == "have_appointment",
+            icon + "<br>" + full_patient_df_plus_pos["wait"].astype("Int64").astype(str)
             )
 
+        full_patient_df_plus_pos = full_patient_df_plus_pos.assign(icon=icon)
+
         fig = generate_animation(
             full_entity_df_plus_pos=full_patient_df_plus_pos,
             event_position_df=event_position_df,
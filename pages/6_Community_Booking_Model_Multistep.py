@@ -1,5 +1,3 @@
-import gc
-import math
 import random
 # Package for webpage development
 import streamlit as st
@@ -9,11 +7,11 @@ import pandas as pd
 # Packages for graphing
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 # Model functions
 from examples.ex_5_community_follow_up.model_classes import Scenario, generate_seed_vector
 from examples.ex_5_community_follow_up.simulation_execution_functions import single_run
-from examples.ex_5_community_follow_up.simulation_summary_functions import results_summary
+from examples.ex_5_community_follow_up.simulation_summary_functions import results_summary, \
+    daily_position_counts as get_daily_position_counts
 # Animation functions
 from vidigi.prep import reshape_for_animations, generate_animation_df
 from vidigi.animation import generate_animation
@@ -24,7 +22,20 @@ st.set_page_config(layout="wide",
                    initial_sidebar_state="expanded",
                    page_title="Mental Health - Booking Model")
 
-gc.collect()
+# The input files don't change while the app is running, so only read them once
+@st.cache_data(show_spinner=False)
+def read_input_file(path):
+    return pd.read_csv(path)
+
+# Reshaping the event log is the slowest step of building the animation, so cache it.
+# It is only rerun when the event log or the reshape settings change
+@st.cache_data(show_spinner=False)
+def reshape_event_log(event_log_df, limit_duration, step_snapshot_max):
+    return reshape_for_animations(event_log_df,
+                                  limit_duration=limit_duration,
+                                  entity_col_name="patient",
+                                  every_x_time_units=1,
+                                  step_snapshot_max=step_snapshot_max)
 
 st.title("Community Service - Repeat Appointment Booking Model with Variable Follow-ups")
 
@@ -90,7 +101,7 @@ st.divider()
 
 st.subheader("Set up Model Parameters")
 
-shifts = pd.read_csv("examples/ex_5_community_follow_up/data/shifts.csv")
+shifts = read_input_file("examples/ex_5_community_follow_up/data/shifts.csv")
 
 number_of_clinicians = st.number_input("Number of Clinicians (caution: changing this will reset any changes you've made to shifts below)",
                 min_value=1, max_value=20, value=8, step=1)
@@ -310,11 +321,11 @@ if button_run_pressed:
         #set up the scenario for the model to run.
         scenarios = {}
 
-        caseload = (pd.read_csv("examples/ex_5_community_follow_up/data/caseload.csv")
+        caseload = (read_input_file("examples/ex_5_community_follow_up/data/caseload.csv")
                    .iloc[:,:number_of_clinicians+1])
-        pooling = (pd.read_csv("examples/ex_5_community_follow_up/data/partial_pooling.csv")
+        pooling = (read_input_file("examples/ex_5_community_follow_up/data/partial_pooling.csv")
                    .iloc[:number_of_clinicians,:number_of_clinicians+1])
-        referrals = (pd.read_csv("examples/ex_5_community_follow_up/data/referrals.csv")
+        referrals = (read_input_file("examples/ex_5_community_follow_up/data/referrals.csv")
                      .iloc[:number_of_clinicians])
 
         scenarios['pooled'] = Scenario(RUN_LENGTH,
@@ -350,16 +361,18 @@ if button_run_pressed:
 
 
         event_log_df['event_original'] = event_log_df['event']
-        event_log_df['event'] = event_log_df.apply(
-            lambda x: f"{x['event']}{f'_{int(x.booked_clinic)}'if pd.notna(x['booked_clinic']) and x['event'] != 'waiting_appointment_to_be_scheduled' else ''}",
-            axis=1
-            )
-
-        full_patient_df = reshape_for_animations(event_log_df,
-                                                 limit_duration=WARM_UP+RESULTS_COLLECTION,
-                                                 entity_col_name="patient",
-                                                 every_x_time_units=1,
-                                                 step_snapshot_max=30)
+        # Add the booked clinic to the event name (e.g. have_appointment_3) so each clinic
+        # gets its own position in the animation. Everyone waiting to be scheduled shares
+        # a single queue
+        booked_clinic = event_log_df['booked_clinic']
+        event_log_df['event'] = event_log_df['event'] + (
+            '_' + booked_clinic.astype('Int64').astype(str)
+            ).where(booked_clinic.notna() &
+                    (event_log_df['event'] != 'waiting_appointment_to_be_scheduled'), '')
+
+        full_patient_df = reshape_event_log(event_log_df,
+                                            limit_duration=WARM_UP+RESULTS_COLLECTION,
+                                            step_snapshot_max=30)
 
         # Remove the warm-up period from the event log
         full_patient_df = full_patient_df[full_patient_df["snapshot_time"] >= WARM_UP]
@@ -368,10 +381,8 @@ if button_run_pressed:
         # Create the positioning dataframe for the animation
         #####################################################
 
-        # Create a list of clinics
-        clinics =  [x for x
-                    in event_log_df['booked_clinic'].sort_values().unique().tolist()
-                    if not math.isnan(x)]
+        # Create a list of clinics (sorting the distinct clinics rather than the whole event log)
+        clinics = sorted(event_log_df['booked_clinic'].dropna().unique().tolist())
 
         # Create a column of positions for people waiting for their initial appointment with the clinic
         clinic_waits = [{'event': f'appointment_booked_waiting_{int(clinic)}',
@@ -388,12 +399,6 @@ if button_run_pressed:
           'label': f"Attending appointment<br>with clinician {int(clinic)}"}
           for clinic in clinics]
 
-        # Join these dataframes
-        event_position_df = pd.concat(
-            [pd.DataFrame(clinic_waits),
-             (pd.DataFrame(clinic_attends))
-             ])
-
         # Create a column of positions for people who are put on a waiting list before being given their future
         # appointment
         wait_for_booking = [{
@@ -403,8 +408,6 @@ if button_run_pressed:
           'label': "Waiting to be<br>scheduled with <br>clinician "
           }]
 
-        event_position_df = pd.concat([event_position_df,(pd.DataFrame(wait_for_booking))])
-
         # Create a column of positions for people being referred to another service (triaged as inappropriate
         # for this service after their initial referral and before an appointment is booked)
         referred_out = [{
@@ -414,8 +417,6 @@ if button_run_pressed:
           'label': "Referred Out:<br>Unsuitable for Service"
           }]
 
-        event_position_df = pd.concat([event_position_df,(pd.DataFrame(referred_out))])
-
         # Create a column of positions for people who have had their initial appointment and are now waiting for a
         # booked follow-up appointment to take place
         follow_up_waiting = [{
@@ -425,9 +426,10 @@ if button_run_pressed:
           'label': f"On books - awaiting <br>next appointment<br>with clinician {int(clinic)}"
           } for clinic in clinics]
 
-        event_position_df = pd.concat([event_position_df,(pd.DataFrame(follow_up_waiting))])
-
-        event_position_df = event_position_df.drop(columns="clinic")
+        # Build the positioning dataframe in one step from all of the position lists
+        event_position_df = pd.DataFrame(
+            clinic_waits + clinic_attends + wait_for_booking + referred_out + follow_up_waiting
+            ).drop(columns="clinic")
 
         full_patient_df_plus_pos = generate_animation_df(
                             full_entity_df=full_patient_df,
@@ -441,23 +443,18 @@ if button_run_pressed:
                             debug_mode=True
                     )
 
-        def show_priority_icon(row):
-            if "more" not in row["icon"]:
-                if row["pathway"] == 2:
-                    return "🚨"
-                else:
-                    return f"{row['icon']}"
-            else:
-                return row["icon"]
-
         def add_los_to_icon(row):
             if row["event_original"] == "have_appointment":
                 return f'{row["icon"]}<br>{int(row["wait"])}'
             else:
                 return row["icon"]
 
+        # Show high priority patients with a different icon. Icons for queues that are too long
+        # to show in full ("+ n more") are left as they are
+        icon = full_patient_df_plus_pos["icon"]
         full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
-            icon=full_patient_df_plus_pos.apply(show_priority_icon, axis=1)
+            icon=icon.mask((~icon.str.contains("more", regex=False)) &
+                           (full_patient_df_plus_pos["pathway"] == 2), "🚨")
             )
 
         # full_patient_df_plus_pos = full_patient_df_plus_pos.assign(
@@ -487,31 +484,32 @@ if button_run_pressed:
             debug_mode=False
         )
 
-        daily_position_counts = []
-
-        for day in range(RUN_LENGTH):
-            # First limit to anyone who hasn't left the system yet
-            # Get a list of all people who have departed on or before the day
-            # of interest as we can then remove them from the dataframe
-            # at the next step
-            departed = event_log_df[
-                (event_log_df["time"] <= day) &
-                (event_log_df["event"] == "depart")]["patient"].tolist()
-            # Filter down to events that have occurred at or before this day
-            upto_now = event_log_df[(event_log_df["time"] <= day)
-                                    & (event_log_df["event"] != "arrival")
-                                    & (~event_log_df["patient"].isin(departed))]
-            # Now take the latest event for each person
-            latest_event_upto_now = upto_now.sort_values("time").groupby("patient").tail(1)
-            for event_type in event_log_df["event_original"].unique():
-                snapshot_count = len(latest_event_upto_now[(latest_event_upto_now["event_original"] == event_type)])
-                daily_position_counts.append(
-                    {"day": day,
-                    "event": event_type,
-                    "count": snapshot_count}
-                )
-
-        daily_position_counts = pd.DataFrame(daily_position_counts)
+        # Count the number of people whose latest event is each event type at the end of each day.
+        # Anyone who has departed on or before the day is not counted
+        daily_position_counts = get_daily_position_counts(event_log_df, RUN_LENGTH)
+
+        # Per-patient views of the event log used by several of the tabs below.
+        # Each is only filtered from the full event log once
+        assessment_booking_waits = (event_log_df
+                                    .dropna(subset='assessment_booking_wait')
+                                    .drop_duplicates(subset='patient')
+                                    [['time','pathway', 'assessment_booking_wait']])
+
+        assessment_waits = (event_log_df
+                            .dropna(subset='wait')
+                            .drop_duplicates(subset='patient')
+                            [['time','pathway', 'wait']])
+
+        follow_ups_intended = (event_log_df
+                               .dropna(subset='follow_ups_intended')
+                               .drop_duplicates(subset='patient')
+                               [['pathway', 'follow_up_intensity', 'follow_ups_intended']])
+
+        # Slot utilisation (excluding the warm-up period), shown in two of the tabs below
+        booked_slots = bookings.iloc[WARM_UP:RUN_LENGTH,].sum()
+        total_slots = booked_slots + available_slots.iloc[WARM_UP:RUN_LENGTH,].sum()
+        slot_utilisation_overall = round((booked_slots.sum() / total_slots.sum())*100, 1)
+        slot_utilisation_by_clinician = round((booked_slots / total_slots).T*100, 1)
 
         tab_summary, tab1,  tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(
             ["Results Summary", "Animated Event Log", "Queue Sizes","Time From Referral to Booking",
@@ -528,10 +526,11 @@ if button_run_pressed:
                 st.markdown("""
                             This looks at the number of people at each point in the system over the simulation's duration.
                             """)
-                fig_daily_position_counts = px.line(daily_position_counts[(daily_position_counts["event"] == "waiting_appointment_to_be_scheduled") |
-                                          (daily_position_counts["event"] == "appointment_booked_waiting") |
-                                          (daily_position_counts["event"] == "follow_up_appointment_booked_waiting")  |
-                                          (daily_position_counts["event"] == "have_appointment")],
+                fig_daily_position_counts = px.line(daily_position_counts[daily_position_counts["event"].isin(
+                                          ["waiting_appointment_to_be_scheduled",
+                                           "appointment_booked_waiting",
+                                           "follow_up_appointment_booked_waiting",
+                                           "have_appointment"])],
                   x="day",
                   y="count",
                   color="event"
@@ -550,11 +549,7 @@ if button_run_pressed:
                 )
 
                 st.subheader("Balance between arrivals and departures")
-                arrival_depart_df = event_log_df[(event_log_df["event"] == "arrival") |
-                                      (event_log_df["event"] == "depart")][["time", "event"]].value_counts().reset_index(drop=False).sort_values('time')
-
-                arrival_depart_df_pivot = arrival_depart_df.pivot(index="time", columns="event", values="count")
-                arrival_depart_df_pivot["difference (arrival-depart) - positive is more more arriving than departing"] = arrival_depart_df_pivot["arrival"] - arrival_depart_df_pivot["depart"]
+                arrival_depart_df = event_log_df[event_log_df["event"].isin(["arrival", "depart"])][["time", "event"]].value_counts().reset_index(drop=False).sort_values('time')
 
                 arrival_depart_balance_fig = px.scatter(
                       arrival_depart_df,
@@ -579,21 +574,21 @@ if button_run_pressed:
                             which will only happen when a clinician has a low enough caseload to take on a new patient
                             """)
 
-                assessment_booking_waits = (event_log_df
-                      .dropna(subset='assessment_booking_wait')
-                      .drop_duplicates(subset='patient')
-                      [['time','pathway', 'assessment_booking_wait']]
-                      )
+                # Mean and longest wait for each pathway in a single pass
+                booking_wait_stats = (assessment_booking_waits
+                                      .groupby('pathway')['assessment_booking_wait']
+                                      .agg(['mean', 'max'])
+                                      .reindex([1, 2]))
 
                 st.write(f"Average wait for booking (high priority):" \
-                         f" {round(np.mean(assessment_booking_waits[assessment_booking_waits['pathway'] == 2]['assessment_booking_wait']),1)}" \
+                         f" {round(booking_wait_stats.loc[2, 'mean'],1)}" \
                          f" (Target: 7 days, Longest " \
-                         f" {round(max(assessment_booking_waits[assessment_booking_waits['pathway'] == 2]['assessment_booking_wait']),1)} days)")
+                         f" {round(booking_wait_stats.loc[2, 'max'],1)} days)")
 
                 st.write(f"Average wait for booking (low priority):" \
-                         f" {round(np.mean(assessment_booking_waits[assessment_booking_waits['pathway'] == 1]['assessment_booking_wait']),1)}" \
+                         f" {round(booking_wait_stats.loc[1, 'mean'],1)}" \
                          f" (Target: 14 days, Longest" \
-                         f" {round(max(assessment_booking_waits[assessment_booking_waits['pathway'] == 1]['assessment_booking_wait']),1)} days)")
+                         f" {round(booking_wait_stats.loc[1, 'max'],1)} days)")
 
                 st.plotly_chart(
                     px.box(
@@ -633,18 +628,14 @@ if button_run_pressed:
 
                 st.plotly_chart(
                     px.box(
-                event_log_df
-                .dropna(subset='wait')
-                .drop_duplicates(subset='patient')[['pathway', 'wait']],
+                assessment_waits,
                 y="wait", x="pathway", color="pathway"
                     ), use_container_width=True
                     )
                 st.subheader("Average Assessment Waits by Pathway Over Time")
                 st.plotly_chart(
                     px.line(
-                      event_log_df
-                      .dropna(subset='wait')
-                      .drop_duplicates(subset='patient')[['time','pathway', 'wait']],
+                      assessment_waits,
                       y="wait", x="time", color="pathway", line_group="pathway"
                     ), use_container_width=True
                     )
@@ -668,8 +659,14 @@ if button_run_pressed:
 
                 # st.write(inter_appointment_gaps)
 
-                st.write(f"Average appointment interval (high priority): {round(np.mean(inter_appointment_gaps[inter_appointment_gaps['follow_up_intensity'] == 'high']['interval']),1)} (Target: 7 days, Longest {round(max(inter_appointment_gaps[inter_appointment_gaps['follow_up_intensity'] == 'high']['interval']),1)} days)")
-                st.write(f"Average appointment interval (high priority): {round(np.mean(inter_appointment_gaps[inter_appointment_gaps['follow_up_intensity'] == 'low']['interval']),1)} (Target: 14 days, Longest {round(max(inter_appointment_gaps[inter_appointment_gaps['follow_up_intensity'] == 'low']['interval']),1)} days)")
+                # Mean and longest interval for each intensity in a single pass
+                interval_stats = (inter_appointment_gaps
+                                  .groupby('follow_up_intensity')['interval']
+                                  .agg(['mean', 'max'])
+                                  .reindex(['high', 'low']))
+
+                st.write(f"Average appointment interval (high priority): {round(interval_stats.loc['high', 'mean'],1)} (Target: 7 days, Longest {round(interval_stats.loc['high', 'max'],1)} days)")
+                st.write(f"Average appointment interval (high priority): {round(interval_stats.loc['low', 'mean'],1)} (Target: 14 days, Longest {round(interval_stats.loc['low', 'max'],1)} days)")
 
                 st.plotly_chart(
                     px.box(
@@ -699,25 +696,9 @@ if button_run_pressed:
                             This looks at the % of slots that clincian's have that end up having a booking.
                             This does not include data from the warm-up period.
                             """)
-                st.write("**Total % of slots used:** {}%".format(
-                   round(
-                        (((bookings.iloc[WARM_UP:RUN_LENGTH,]).sum().sum() /
-                          ((bookings.iloc[WARM_UP:RUN_LENGTH,]) + available_slots.iloc[WARM_UP:RUN_LENGTH,]).sum().sum())
-                          )*100,
-                          1
-                        )
-                      )
-                )
+                st.write("**Total % of slots used:** {}%".format(slot_utilisation_overall))
 
-
-                st.write(
-                    round(
-                        (((bookings.iloc[WARM_UP:RUN_LENGTH,]).sum() /
-                          ((bookings.iloc[WARM_UP:RUN_LENGTH,]) + available_slots.iloc[WARM_UP:RUN_LENGTH,]).sum()).T
-                          )*100,
-                          1
-                        )
-                      )
+                st.write(slot_utilisation_by_clinician)
 
 
 
@@ -735,9 +716,9 @@ if button_run_pressed:
                 # Want two trendlines on the same fig
                 # Using answer from
                 # https://community.plotly.com/t/displaying-2-trendlines-for-1-set-of-data-with-plotly/68972/2
-                fig_arrivals = go.Figure(make_subplots(rows=1, cols=1))
+                daily_arrival_counts = pd.DataFrame(pd.Series(daily_arrivals).value_counts()).reset_index(drop=False)
                 fig_arrivals_1 = px.scatter(
-                        pd.DataFrame(pd.Series(daily_arrivals).value_counts()).reset_index(drop=False),
+                        daily_arrival_counts,
                         x="index",
                         y="count",
                         trendline="rolling",
@@ -745,23 +726,19 @@ if button_run_pressed:
                         trendline_options=dict(window=7)#,
                     )
                 fig_arrivals_2 = px.scatter(
-                        pd.DataFrame(pd.Series(daily_arrivals).value_counts()).reset_index(drop=False),
+                        daily_arrival_counts,
                         x="index",
                         y="count",
                         trendline="rolling",
                         trendline_options=dict(window=60),
                         color_discrete_sequence=['red']
                     )
-                fig_arrivals_2.data = [t for t in fig_arrivals_2.data if t.mode == "lines"]
-                fig_trace = []
-
-                for trace in range(len(fig_arrivals_1["data"])):
-                    fig_trace.append(fig_arrivals_1["data"][trace])
-                for trace in range(len(fig_arrivals_2["data"])):
-                    fig_trace.append(fig_arrivals_2["data"][trace])
-
-                for traces in fig_trace:
-                    fig_arrivals.append_trace(traces, row=1, col=1)
+                # Build the figure directly from both sets of traces, keeping only the
+                # trendline from the second
+                fig_arrivals = go.Figure(
+                    data=fig_arrivals_1.data +
+                         tuple(t for t in fig_arrivals_2.data if t.mode == "lines")
+                    )
 
                 st.plotly_chart(
                     fig_arrivals, use_container_width=True
@@ -834,9 +811,7 @@ if button_run_pressed:
               """
             )
             st.dataframe(
-                event_log_df
-                .dropna(subset='follow_ups_intended')
-                .drop_duplicates(subset='patient')
+                follow_ups_intended
                 .groupby(['pathway','follow_up_intensity'])['follow_ups_intended']
                 .describe()
                 .T
@@ -851,9 +826,7 @@ if button_run_pressed:
 
             st.plotly_chart(
                 px.bar(
-                event_log_df
-                  .dropna(subset='follow_ups_intended')
-                  .drop_duplicates(subset='patient')[['pathway','follow_ups_intended']]
+                follow_ups_intended[['pathway','follow_ups_intended']]
                   .value_counts()
                   .reset_index(drop=False),
                 x="follow_ups_intended", y="count",facet_row="pathway"
@@ -874,9 +847,7 @@ if button_run_pressed:
             st.subheader("Time from referral to appointment booking")
 
             st.write(
-                event_log_df
-                .dropna(subset='assessment_booking_wait')
-                .drop_duplicates(subset='patient')
+                assessment_booking_waits
                 .groupby('pathway')['assessment_booking_wait']
                 .describe()
                 .T
@@ -892,9 +863,7 @@ if button_run_pressed:
 
             st.plotly_chart(
                 px.bar(
-                event_log_df
-                .dropna(subset='assessment_booking_wait')
-                .drop_duplicates(subset='patient')
+                assessment_booking_waits
                 .groupby('pathway')[['pathway','assessment_booking_wait']]
                 .value_counts()
                 .reset_index(drop=False),
@@ -913,19 +882,9 @@ if button_run_pressed:
         with tab6:
             st.subheader("Slot Utilisation - % of Slots Used")
 
-            st.write(
-                    round(
-                        (((bookings.iloc[WARM_UP:RUN_LENGTH,]).sum().sum() /
-                          ((bookings.iloc[WARM_UP:RUN_LENGTH,]) + available_slots.iloc[WARM_UP:RUN_LENGTH,]).sum().sum())
-                          )*100,
-                          1
-                        )
-                      )
+            st.write(slot_utilisation_overall)
 
-            st.write(
-                round((((bookings.iloc[WARM_UP:RUN_LENGTH,]).sum() /
-                ((bookings.iloc[WARM_UP:RUN_LENGTH,]) + available_slots.iloc[WARM_UP:RUN_LENGTH,]).sum()).T)*100,1)
-                    )
+            st.write(slot_utilisation_by_clinician)
 
         with tab7:
             st.subheader("Daily Caseload Snapshots")